@@ -0,0 +1,205 @@
+import threading
+import time
+import zlib
+import cv2
+import numpy as np
+
+from protocol import CODEC_JPEG, CODEC_PNG, CODEC_PALETTE, CODEC_RAW
+
+# Supported decode reduction factors and the matching reduced JPEG decode modes
+DECODE_REDUCTIONS = (1, 2, 4, 8)
+JPEG_REDUCED_MODES = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+
+class FrameCodec:
+    """
+    Base class for tile codecs
+
+    Subclasses implement encode() and decode(). Callers should go through
+    timed_encode() and timed_decode() so every codec reports its cost.
+
+    decode() can return the tile reduced by a factor from DECODE_REDUCTIONS;
+    the result is always ceil(width / reduction) x ceil(height / reduction),
+    so reduced tiles still line up in a reduced framebuffer.
+    """
+
+    codec_id = None
+    name = None
+    lossless = False
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.encode_count = 0
+        self.encode_time = 0.0
+        self.encode_pixels = 0
+        self.encode_bytes = 0
+        self.decode_count = 0
+        self.decode_time = 0.0
+        self.decode_pixels = 0
+
+    def encode(self, image, quality):
+        """Encode a BGR image, returning a bytes-like object"""
+        raise NotImplementedError
+
+    def decode(self, data, width, height, reduction=1):
+        """Decode a tile back into a BGR image of the given size, divided by reduction"""
+        raise NotImplementedError
+
+    @staticmethod
+    def reduce(image, reduction):
+        """Subsample a fully decoded tile for codecs without a native reduced decode"""
+        if reduction == 1:
+            return image
+        return image[::reduction, ::reduction]
+
+    def timed_encode(self, image, quality):
+        """Encode a BGR image and record the time and size it took"""
+        start = time.perf_counter()
+        encoded = self.encode(image, quality)
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.encode_count += 1
+            self.encode_time += elapsed
+            self.encode_pixels += image.shape[0] * image.shape[1]
+            self.encode_bytes += memoryview(encoded).nbytes
+        return encoded
+
+    def timed_decode(self, data, width, height, reduction=1):
+        """Decode a tile and record the time it took"""
+        start = time.perf_counter()
+        image = self.decode(data, width, height, reduction)
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.decode_count += 1
+            self.decode_time += elapsed
+            self.decode_pixels += width * height
+        return image
+
+    def get_stats(self):
+        """Get the average encode/decode cost per megapixel and the compressed size"""
+        with self.lock:
+            encode_mp = self.encode_pixels / 1e6
+            decode_mp = self.decode_pixels / 1e6
+            return {
+                'lossless': self.lossless,
+                'encoded_tiles': self.encode_count,
+                'decoded_tiles': self.decode_count,
+                'encode_ms_per_mp': self.encode_time * 1000 / encode_mp if encode_mp else None,
+                'decode_ms_per_mp': self.decode_time * 1000 / decode_mp if decode_mp else None,
+                'bytes_per_pixel': self.encode_bytes / self.encode_pixels if self.encode_pixels else None
+            }
+
+
+class JpegCodec(FrameCodec):
+    """Lossy JPEG; smallest output for photos and video, smears text"""
+
+    codec_id = CODEC_JPEG
+    name = 'jpeg'
+
+    def encode(self, image, quality):
+        _, encoded = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        return encoded
+
+    def decode(self, data, width, height, reduction=1):
+        # libjpeg scales while decoding (DCT scaling), so a reduced decode does far less work
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), JPEG_REDUCED_MODES[reduction])
+
+
+class PngCodec(FrameCodec):
+    """Lossless PNG at a fast compression level; sharp text for terminals and IDEs"""
+
+    codec_id = CODEC_PNG
+    name = 'png'
+    lossless = True
+
+    def encode(self, image, quality):
+        _, encoded = cv2.imencode('.png', image, [int(cv2.IMWRITE_PNG_COMPRESSION), 1])
+        return encoded
+
+    def decode(self, data, width, height, reduction=1):
+        return self.reduce(cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR), reduction)
+
+
+class PaletteCodec(FrameCodec):
+    """
+    Fixed 256-colour (RGB 3-3-2) palette followed by zlib
+
+    Quantization is a handful of vectorized bit operations, so encoding is
+    far cheaper than JPEG or PNG while flat UI colours and text edges stay crisp.
+    """
+
+    codec_id = CODEC_PALETTE
+    name = 'palette'
+
+    def __init__(self):
+        super().__init__()
+
+        # Palette index -> BGR colour, expanding each field back to the full 0-255 range
+        indices = np.arange(256)
+        self.palette = np.stack([
+            (indices & 0x03) * 255 // 3,
+            ((indices >> 2) & 0x07) * 255 // 7,
+            ((indices >> 5) & 0x07) * 255 // 7
+        ], axis=1).astype(np.uint8)
+
+    def encode(self, image, quality):
+        # Pack the top 3 bits of red and green and the top 2 bits of blue into one byte
+        indices = image[:, :, 2] & 0xE0
+        indices |= (image[:, :, 1] & 0xE0) >> 3
+        indices |= image[:, :, 0] >> 6
+        return zlib.compress(indices, 1)
+
+    def decode(self, data, width, height, reduction=1):
+        indices = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(height, width)
+        # Reduce before the palette lookup so only the kept pixels are expanded
+        return self.palette[self.reduce(indices, reduction)]
+
+
+class RawCodec(FrameCodec):
+    """Uncompressed BGR pixels; no CPU cost, for fast local links"""
+
+    codec_id = CODEC_RAW
+    name = 'raw'
+    lossless = True
+
+    def encode(self, image, quality):
+        return np.ascontiguousarray(image)
+
+    def decode(self, data, width, height, reduction=1):
+        return self.reduce(np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3), reduction)
+
+
+# Codec registry, keyed by wire id and by name
+CODECS = {}
+CODECS_BY_NAME = {}
+
+DEFAULT_CODEC = 'jpeg'
+
+
+def register_codec(codec):
+    """Add a codec instance to the registry"""
+    CODECS[codec.codec_id] = codec
+    CODECS_BY_NAME[codec.name] = codec
+
+
+def get_codec(key):
+    """Look up a codec by wire id or name, raising KeyError if it is unknown"""
+    if isinstance(key, str):
+        return CODECS_BY_NAME[key]
+    return CODECS[key]
+
+
+def get_codec_names():
+    """Get the names of all registered codecs"""
+    return list(CODECS_BY_NAME)
+
+
+for _codec_class in (JpegCodec, PngCodec, PaletteCodec, RawCodec):
+    register_codec(_codec_class())
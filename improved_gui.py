@@ -1,6 +1,5 @@
 import sys
 import os
-import cv2
 import numpy as np
 import traceback
 from PyQt5.QtWidgets import (
@@ -15,7 +14,7 @@ from PyQt5.QtGui import (
     QBrush, QLinearGradient, QRadialGradient, QPen, QKeySequence
 )
 from PyQt5.QtCore import (
-    Qt, QTimer, QSize, QThread, pyqtSignal, QRect, QPoint, QEvent
+    Qt, QTimer, QSize, pyqtSignal, QRect, QPoint, QEvent
 )
 import threading
 import time
@@ -23,34 +22,101 @@ import time
 # Import our extracted client classes
 from remote_client import RemoteControlClient
 from auth_client import AuthClient
+from frame_codecs import DEFAULT_CODEC, get_codec, get_codec_names
 
-# Background thread for frame updates
-class VideoThread(QThread):
-    update_frame = pyqtSignal(np.ndarray)
+# Label that paints remote frames directly
+class FrameDisplay(QLabel):
+    """
+    Displays remote frames without per-frame conversions or copies
     
-    def __init__(self, client):
-        super().__init__()
-        self.client = client
-        self.running = True
+    Frames are wrapped as BGR888 QImages over the decoded buffer and drawn
+    scaled into a cached target rect, which is only recomputed when the
+    frame size or the label size changes. Overlays are painted on top with
+    QPainter instead of being blended into the frame pixels.
+    """
+    
+    def __init__(self, text, parent=None):
+        super().__init__(text, parent)
+        
+        # The frame array owns the pixels the QImage points at, so keep it alive
+        self.frame = None
+        self.image = None
+        
+        # Where the image is drawn within the label (centered, aspect ratio kept)
+        self.image_rect = QRect()
+        
+        # (text, QColor) status lines painted over the image
+        self.overlays = []
+    
+    def set_frame(self, frame, overlays):
+        """
+        Show a new BGR frame (the frame must not be modified afterwards)
+        
+        Returns:
+            bool: True if the frame size changed and the image rect moved
+        """
+        frame = np.ascontiguousarray(frame)
+        height, width = frame.shape[:2]
+        size_changed = self.image is None or (self.image.width(), self.image.height()) != (width, height)
+        
+        self.frame = frame
+        self.image = QImage(frame.data, width, height, frame.strides[0], QImage.Format_BGR888)
+        self.overlays = overlays
+        
+        if size_changed:
+            self.update_image_rect()
+        self.update()
+        return size_changed
     
-    def run(self):
-        while self.running:
-            try:
-                frame = self.client.get_latest_frame()
-                if frame is not None:
-                    self.update_frame.emit(frame)
-            except Exception as e:
-                print(f"Video thread error: {e}")
-            self.msleep(30)  # ~30 FPS
+    def update_image_rect(self):
+        """Fit the image into the label, keeping its aspect ratio"""
+        if self.image is None:
+            return
+        
+        size = self.image.size().scaled(self.size(), Qt.KeepAspectRatio)
+        self.image_rect = QRect(
+            QPoint((self.width() - size.width()) // 2, (self.height() - size.height()) // 2),
+            size
+        )
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_image_rect()
     
-    def stop(self):
-        self.running = False
-        self.wait()
+    def paintEvent(self, event):
+        # Show the placeholder text until the first frame arrives
+        if self.image is None:
+            super().paintEvent(event)
+            return
+        
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawImage(self.image_rect, self.image)
+        
+        # Status lines on a semi-transparent background
+        font = painter.font()
+        font.setBold(True)
+        painter.setFont(font)
+        metrics = painter.fontMetrics()
+        
+        y = self.image_rect.top() + 10
+        for text, color in self.overlays:
+            box = QRect(self.image_rect.left() + 10, y, metrics.horizontalAdvance(text) + 20, metrics.height() + 10)
+            painter.fillRect(box, QColor(0, 0, 0, 153))
+            painter.setPen(color)
+            painter.drawText(box, Qt.AlignCenter, text)
+            y += box.height() + 10
+        
+        painter.end()
 
 # Full-screen remote display window
 class RemoteDisplayWindow(QMainWindow):
     closed = pyqtSignal()
     
+    # Emitted from the client's decode thread with a new frame's sequence number;
+    # the connection is queued, so the frame is rendered on the GUI thread
+    frame_ready = pyqtSignal(int)
+    
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Remote Display")
@@ -107,6 +173,30 @@ class RemoteDisplayWindow(QMainWindow):
         # Current keyboard mode (typing or command)
         self.current_mode = "typing"
         
+        # Codec selector (lossless codecs keep terminal and IDE text sharp)
+        self.codec_combo = QComboBox()
+        self.codec_combo.setToolTip("Screen codec")
+        for codec_name in get_codec_names():
+            label = codec_name.upper()
+            if get_codec(codec_name).lossless:
+                label += " (lossless)"
+            self.codec_combo.addItem(label, codec_name)
+        self.codec_combo.setCurrentIndex(self.codec_combo.findData(DEFAULT_CODEC))
+        self.codec_combo.currentIndexChanged.connect(self.change_codec)
+        self.toolbar.addWidget(self.codec_combo)
+        
+        # Input latency HUD toggle
+        self.latency_action = QAction("Latency HUD", self)
+        self.latency_action.setCheckable(True)
+        self.latency_action.setChecked(False)
+        self.latency_action.triggered.connect(self.toggle_latency_hud)
+        self.toolbar.addAction(self.latency_action)
+        self.show_latency_hud = False
+        
+        # Refreshes the HUD while it is shown, since a static screen delivers no frames
+        self.latency_timer = QTimer(self)
+        self.latency_timer.timeout.connect(self.refresh_overlays)
+        
         # Spacer to push disconnect to the right
         spacer = QWidget()
         spacer.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
@@ -118,7 +208,7 @@ class RemoteDisplayWindow(QMainWindow):
         self.toolbar.addAction(self.disconnect_action)
         
         # Frame display
-        self.frame_display = QLabel("Connecting to remote computer...")
+        self.frame_display = FrameDisplay("Connecting to remote computer...")
         self.frame_display.setAlignment(Qt.AlignCenter)
         self.frame_display.setMinimumSize(800, 600)
         self.frame_display.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
@@ -143,10 +233,28 @@ class RemoteDisplayWindow(QMainWindow):
         self.control_shortcut = QShortcut(QKeySequence("Ctrl+T"), self)
         self.control_shortcut.activated.connect(self.toggle_control)
         
+        # Add shortcut for the latency HUD (Ctrl+L)
+        self.latency_shortcut = QShortcut(QKeySequence("Ctrl+L"), self)
+        self.latency_shortcut.activated.connect(self.toggle_latency_hud)
+        
         # Reference to remote client
         self.remote_client = None
         self.control_enabled = True
         
+        # Push-based frame delivery: at most one frame_ready signal is queued at
+        # a time, so frames the GUI is too slow for are coalesced into the newest
+        self.frame_signal_pending = threading.Event()
+        self.displayed_sequence = 0
+        self.frame_ready.connect(self.show_latest_frame)
+        
+        # Last frame shown, kept so overlays can be repainted while the remote screen is static
+        self.last_frame = None
+        
+        # Repaints once the client's status message has expired
+        self.status_timer = QTimer(self)
+        self.status_timer.setSingleShot(True)
+        self.status_timer.timeout.connect(self.refresh_overlays)
+        
         # Set a timer to update frame geometry periodically
         self.update_timer = QTimer(self)
         self.update_timer.timeout.connect(self.update_frame_geometry)
@@ -191,6 +299,8 @@ class RemoteDisplayWindow(QMainWindow):
         # Update control status in the remote client
         if self.remote_client:
             self.remote_client.control_enabled = self.control_enabled
+        
+        self.refresh_overlays()
     
     def toggle_mode(self):
         """Toggle between typing and command mode"""
@@ -210,70 +320,106 @@ class RemoteDisplayWindow(QMainWindow):
             self.remote_client.keyboard_mode = self.current_mode
             # Call the client's show_status method to display on screen
             self.remote_client.show_status(f"{self.current_mode.upper()} MODE", 3.0)
+        
+        self.refresh_overlays()
+    
+    def toggle_latency_hud(self):
+        """Show or hide input latency percentiles over the remote screen"""
+        self.show_latency_hud = not self.show_latency_hud
+        self.latency_action.setChecked(self.show_latency_hud)
+        self.status_bar.showMessage(f"Latency HUD {'shown' if self.show_latency_hud else 'hidden'}", 3000)
+        
+        if self.show_latency_hud:
+            self.latency_timer.start(500)
+        else:
+            self.latency_timer.stop()
+        self.refresh_overlays()
+    
+    def get_latency_hud_lines(self):
+        """Format the client's input latency histograms as overlay lines"""
+        stats = self.remote_client.get_input_latency_stats()
+        lines = []
+        for label, key in (("INPUT->INJECT", 'input_to_inject'), ("INPUT->PHOTON", 'input_to_photon')):
+            histogram = stats[key]
+            if histogram['count']:
+                text = (f"{label} p50 {histogram['p50_ms']:.0f} ms  p95 {histogram['p95_ms']:.0f} ms  "
+                        f"max {histogram['max_ms']:.0f} ms  (n={histogram['count']})")
+            else:
+                text = f"{label} no samples"
+            lines.append((text, QColor(255, 255, 0)))
+        return lines
+    
+    def change_codec(self, index):
+        """Ask the server to encode frames with the selected codec"""
+        codec_name = self.codec_combo.itemData(index)
+        if not self.remote_client:
+            return
+        
+        if self.remote_client.set_codec(codec_name):
+            self.status_bar.showMessage(f"Codec: {codec_name.upper()}", 3000)
+        else:
+            self.status_bar.showMessage(f"Codec {codec_name.upper()} is not available on this server", 3000)
+            self.codec_combo.blockSignals(True)
+            self.codec_combo.setCurrentIndex(self.codec_combo.findData(self.remote_client.codec_name))
+            self.codec_combo.blockSignals(False)
     
     def set_remote_client(self, client):
         self.remote_client = client
         self.update_frame_geometry()
     
+    def notify_frame(self, sequence):
+        """Called from the decode thread when a new frame has been published"""
+        if not self.frame_signal_pending.is_set():
+            self.frame_signal_pending.set()
+            self.frame_ready.emit(sequence)
+    
+    def show_latest_frame(self, sequence):
+        """Render the newest published frame on the GUI thread"""
+        # Clear before fetching so a frame published after the fetch queues a new signal
+        self.frame_signal_pending.clear()
+        if not self.remote_client:
+            return
+        
+        sequence, frame = self.remote_client.get_latest_frame_with_sequence()
+        if sequence == self.displayed_sequence:
+            return
+        
+        self.displayed_sequence = sequence
+        self.update_frame(frame)
+    
+    def refresh_overlays(self):
+        """Repaint the overlays over the last frame; unchanged frames are not delivered again"""
+        self.update_frame(self.last_frame)
+    
     def update_frame(self, frame):
         """Update the displayed frame with status overlay if needed"""
         try:
             if frame is None:
                 return
-                
-            # Make a copy of the frame for overlay display
-            display_frame = frame.copy()
-            
-            # Add mode indicator to the frame
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            mode_text = f"MODE: {self.current_mode.upper()}"
-            text_size = cv2.getTextSize(mode_text, font, 0.7, 2)[0]
-            
-            # Add a semi-transparent background for better visibility
-            overlay = display_frame.copy()
-            cv2.rectangle(overlay, (10, 10), (30 + text_size[0], 40), (0, 0, 0), -1)
-            cv2.addWeighted(overlay, 0.6, display_frame, 0.4, 0, display_frame)
-            
-            # Add mode text
-            cv2.putText(display_frame, mode_text, (20, 30), font, 0.7, 
-                        (0, 255, 0) if self.current_mode == "typing" else (0, 165, 255), 
-                        2, cv2.LINE_AA)
-            
-            # Add control status if disabled
+            self.last_frame = frame
+            
+            # Mode indicator, plus the control status if disabled; painted over
+            # the frame by the display rather than blended into its pixels
+            overlays = [(
+                f"MODE: {self.current_mode.upper()}",
+                QColor(0, 255, 0) if self.current_mode == "typing" else QColor(255, 165, 0)
+            )]
             if not self.control_enabled:
-                control_text = "CONTROL DISABLED"
-                control_size = cv2.getTextSize(control_text, font, 0.7, 2)[0]
-                
-                # Add background for control status
-                overlay = display_frame.copy()
-                cv2.rectangle(overlay, (10, 50), (30 + control_size[0], 80), (0, 0, 0), -1)
-                cv2.addWeighted(overlay, 0.6, display_frame, 0.4, 0, display_frame)
-                
-                # Add control status text
-                cv2.putText(display_frame, control_text, (20, 70), font, 0.7, (0, 0, 255), 2, cv2.LINE_AA)
-            
-            # Convert OpenCV BGR format to RGB for Qt
-            rgb_frame = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_frame.shape
-            
-            # Create QImage from the RGB data
-            qt_image = QImage(rgb_frame.data, w, h, w * ch, QImage.Format_RGB888)
+                overlays.append(("CONTROL DISABLED", QColor(255, 0, 0)))
             
-            # Convert to pixmap and display
-            pixmap = QPixmap.fromImage(qt_image)
+            # Transient status message from the client, cleared once it expires
+            # even if no new frame arrives by then
+            if self.remote_client and time.time() < self.remote_client.status_display_time:
+                overlays.append((self.remote_client.status_message, QColor(0, 255, 0)))
+                remaining = self.remote_client.status_display_time - time.time()
+                self.status_timer.start(int(remaining * 1000) + 50)
             
-            # Scale pixmap to fit the label while maintaining aspect ratio
-            pixmap = pixmap.scaled(
-                self.frame_display.width(),
-                self.frame_display.height(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            
-            self.frame_display.setPixmap(pixmap)
+            if self.show_latency_hud and self.remote_client:
+                overlays.extend(self.get_latency_hud_lines())
             
-            # Update the frame geometry info in the client
-            self.update_frame_geometry()
+            # Only a change in the remote frame size moves the displayed image
+            if self.frame_display.set_frame(frame, overlays):
+                self.update_frame_geometry()
             
         except Exception as e:
             print(f"Error updating frame: {e}")
@@ -290,24 +436,22 @@ class RemoteDisplayWindow(QMainWindow):
         # Get the size
         size = self.frame_display.size()
         
-        # Get the actual image size (could be smaller due to aspect ratio)
-        pixmap = self.frame_display.pixmap()
-        if pixmap and not pixmap.isNull():
-            # Calculate the actual image rect within the label (centered)
-            pixmap_width = pixmap.width()
-            pixmap_height = pixmap.height()
-            
-            # Calculate position adjustments for centering
-            x_offset = (size.width() - pixmap_width) // 2
-            y_offset = (size.height() - pixmap_height) // 2
-            
+        # Declare the display size (in device pixels) so the server encodes at display resolution
+        pixel_ratio = self.frame_display.devicePixelRatioF()
+        self.remote_client.set_viewport_size(
+            int(size.width() * pixel_ratio),
+            int(size.height() * pixel_ratio)
+        )
+        
+        # Get the actual image rect (could be smaller due to aspect ratio)
+        image_rect = self.frame_display.image_rect
+        if not image_rect.isEmpty():
             # Update the global position to account for the image position within the label
-            global_pos.setX(global_pos.x() + x_offset)
-            global_pos.setY(global_pos.y() + y_offset)
+            global_pos.setX(global_pos.x() + image_rect.x())
+            global_pos.setY(global_pos.y() + image_rect.y())
             
-            # Use the actual pixmap size
-            size.setWidth(pixmap_width)
-            size.setHeight(pixmap_height)
+            # Use the actual image size
+            size = image_rect.size()
         
         # Update the remote client with this information
         self.remote_client.set_gui_window_info(
@@ -315,6 +459,11 @@ class RemoteDisplayWindow(QMainWindow):
             size.width(), size.height()
         )
     
+    def resizeEvent(self, event):
+        """Re-declare the frame geometry once the layout has settled after a resize"""
+        super().resizeEvent(event)
+        QTimer.singleShot(0, self.update_frame_geometry)
+    
     def eventFilter(self, watched, event):
         """Event filter to handle mouse and keyboard events"""
         if watched == self.frame_display:
@@ -765,10 +914,11 @@ class RemoteControlApp(QMainWindow):
             self.remote_display.closed.connect(self.handle_disconnect)
             self.remote_display.set_remote_client(self.remote_client)
             
-            # Define a frame update callback for the GUI
-            def frame_callback(frame):
+            # New frames are announced to the display window, which fetches
+            # and renders them on the GUI thread
+            def frame_callback(sequence):
                 if self.remote_display:
-                    self.remote_display.update_frame(frame)
+                    self.remote_display.notify_frame(sequence)
             
             # Start the remote client with our callback
             if self.remote_client.start(frame_callback=frame_callback):
@@ -0,0 +1,101 @@
+import struct
+
+# Wire format for the mouse/keyboard channel. After authentication the
+# client streams batches of fixed-size little-endian event records:
+#
+#   batch := INPUT_BATCH event*      (count events, in the order they happened)
+#   event := INPUT_EVENT
+
+# Event types
+EVENT_MOVE = 1         # x, y: absolute server coordinates
+EVENT_CLICK = 2        # x, y: absolute server coordinates; button
+EVENT_SCROLL = 3       # x, y: scroll steps (dx, dy)
+EVENT_KEY_PRESS = 4    # key: key code
+EVENT_KEY_RELEASE = 5  # key: key code
+
+# Mouse buttons
+BUTTON_NONE = 0
+BUTTON_LEFT = 1
+BUTTON_RIGHT = 2
+
+# event type, button, (padding), event ID, key code, x, y, client timestamp.
+# Event IDs increase by one per event; frames echo the last one injected.
+INPUT_EVENT = struct.Struct('<BBxxIIiid')
+
+# event count
+INPUT_BATCH = struct.Struct('<H')
+
+# Upper bound on events per batch, to reject corrupt headers early
+MAX_INPUT_BATCH = 1024
+
+# Key codes: characters are sent as their Unicode code point, named keys as
+# SPECIAL_KEY_BASE + their index in SPECIAL_KEYS, and keys that only have a
+# platform virtual-key code as VK_KEY_BASE + vk. Both bases lie above the
+# Unicode range.
+SPECIAL_KEY_BASE = 0x110000
+VK_KEY_BASE = 0x120000
+
+# pynput Key names by wire index. Only ever append: the index is the wire code.
+SPECIAL_KEYS = (
+    'alt', 'alt_l', 'alt_r', 'alt_gr', 'backspace', 'caps_lock',
+    'cmd', 'cmd_l', 'cmd_r', 'ctrl', 'ctrl_l', 'ctrl_r',
+    'delete', 'down', 'end', 'enter', 'esc', 'home', 'left',
+    'page_down', 'page_up', 'right', 'shift', 'shift_l', 'shift_r',
+    'space', 'tab', 'up',
+    'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8', 'f9', 'f10',
+    'f11', 'f12', 'f13', 'f14', 'f15', 'f16', 'f17', 'f18', 'f19', 'f20',
+    'media_play_pause', 'media_volume_mute', 'media_volume_down',
+    'media_volume_up', 'media_previous', 'media_next',
+    'insert', 'menu', 'num_lock', 'pause', 'print_screen', 'scroll_lock'
+)
+
+
+def pack_input_batch(events):
+    """
+    Build a batch message from packed INPUT_EVENT records
+
+    Args:
+        events (list): INPUT_EVENT records, oldest first
+
+    Returns:
+        bytes: Batch header followed by the records
+    """
+    return INPUT_BATCH.pack(len(events)) + b''.join(events)
+
+
+def build_key_codes(key_enum):
+    """
+    Map the platform's named keys to wire codes (client side)
+
+    Args:
+        key_enum: pynput's Key enum
+
+    Returns:
+        dict: Key member -> key code, for the names this platform defines
+    """
+    return {
+        getattr(key_enum, name): SPECIAL_KEY_BASE + index
+        for index, name in enumerate(SPECIAL_KEYS)
+        if hasattr(key_enum, name)
+    }
+
+
+def build_key_table(key_enum):
+    """
+    Map wire codes of named keys to the platform's keys (server side)
+
+    Built from the names rather than by inverting build_key_codes: pynput
+    aliases some names to one member on some platforms (e.g. alt_r and
+    alt_gr on Windows), and every name's code must still resolve.
+
+    Args:
+        key_enum: pynput's Key enum
+
+    Returns:
+        dict: Key code -> Key member, for the names this platform defines
+    """
+    return {
+        SPECIAL_KEY_BASE + index: getattr(key_enum, name)
+        for index, name in enumerate(SPECIAL_KEYS)
+        if hasattr(key_enum, name)
+    }
@@ -0,0 +1,140 @@
+import threading
+from collections import deque
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram
+
+    Samples are recorded in seconds and reported in milliseconds.
+    Percentiles are approximate: they report the upper edge of the bucket
+    the percentile falls into.
+    """
+
+    # Upper bucket edges in milliseconds; one more bucket catches everything above
+    BUCKETS_MS = (1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 300, 500, 1000)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clear all samples"""
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Record one latency sample"""
+        milliseconds = max(0.0, seconds * 1000)
+        for index, edge in enumerate(self.BUCKETS_MS):
+            if milliseconds <= edge:
+                break
+        else:
+            index = len(self.BUCKETS_MS)
+
+        self.counts[index] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def percentile(self, fraction):
+        """Get the approximate latency (ms) below which `fraction` of samples fall"""
+        if not self.count:
+            return None
+
+        threshold = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return self.BUCKETS_MS[index] if index < len(self.BUCKETS_MS) else self.max
+        return self.max
+
+    def get_stats(self):
+        """Get the summary and the per-bucket counts"""
+        labels = [f"<={edge}ms" for edge in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return {
+            'count': self.count,
+            'avg_ms': self.total / self.count if self.count else None,
+            'max_ms': self.max,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+
+class InputLatencyTracker:
+    """
+    Matches input events to the screen frames that reflect them
+
+    The client numbers and timestamps every input event; the server puts the
+    ID and injection time of the last event it injected into each frame
+    header. Input-to-photon latency (event to frame display) is measured on
+    the client clock alone. Input-to-inject needs the server's injection time
+    on the client clock, so the clock offset is estimated as the smallest
+    recent (frame receive time - capture time); that also absorbs the
+    minimum one-way network delay, making it a slight underestimate.
+    """
+
+    def __init__(self, max_pending=4096, offset_window=128):
+        self.lock = threading.Lock()
+
+        # (event ID, client timestamp) of sent events not yet seen in a frame, oldest first
+        self.pending = deque(maxlen=max_pending)
+
+        # Recent (receive time - capture time) samples for the clock offset estimate
+        self.offset_samples = deque(maxlen=offset_window)
+
+        self.inject = LatencyHistogram()
+        self.photon = LatencyHistogram()
+
+    def reset(self):
+        """Forget pending events and clear the histograms (e.g. after a reconnect)"""
+        with self.lock:
+            self.pending.clear()
+            self.offset_samples.clear()
+            self.inject.reset()
+            self.photon.reset()
+
+    def record_sent(self, event_id, timestamp):
+        """Record an input event handed to the network"""
+        with self.lock:
+            self.pending.append((event_id, timestamp))
+
+    def record_clock_sample(self, server_time, receive_time):
+        """Record a frame's capture time (server clock) against its receive time (client clock)"""
+        if server_time:
+            with self.lock:
+                self.offset_samples.append(receive_time - server_time)
+
+    def record_frame(self, input_id, input_time, visible, display_time):
+        """
+        Account for the events a displayed frame reflects
+
+        Args:
+            input_id (int): Last injected event ID from the frame header
+            input_time (float): Its injection time (server clock), 0 if none
+            visible (bool): False for keep-alives, which show nothing new;
+                their events count towards injection latency only
+            display_time (float): When the frame was handed to the display
+        """
+        with self.lock:
+            offset = min(self.offset_samples) if self.offset_samples else None
+
+            while self.pending and self.pending[0][0] <= input_id:
+                _, timestamp = self.pending.popleft()
+                if input_time and offset is not None:
+                    self.inject.record(input_time + offset - timestamp)
+                if visible:
+                    self.photon.record(display_time - timestamp)
+
+    def get_stats(self):
+        """Get the input-to-inject and input-to-photon histograms"""
+        with self.lock:
+            return {
+                'input_to_inject': self.inject.get_stats(),
+                'input_to_photon': self.photon.get_stats(),
+                'pending_events': len(self.pending)
+            }
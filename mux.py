@@ -0,0 +1,227 @@
+import json
+import socket
+import struct
+import threading
+import logging
+from collections import deque
+
+from protocol import ProtocolError
+
+logger = logging.getLogger("Mux")
+
+# Optional single-connection mode: auth, screen and input share one socket as
+# prioritized sub-streams. Every message is split into chunks:
+#
+#   message := chunk* final-chunk          (all on the same channel)
+#   chunk   := CHUNK_HEADER data           (length bytes)
+#
+# Chunks of different channels interleave, so a click never waits behind a
+# whole screen frame, only behind the chunk already on the wire.
+
+# Channels
+CHANNEL_CONTROL = 0  # JSON: session handshake and screen control messages
+CHANNEL_INPUT = 1    # Input batches (input_protocol.py)
+CHANNEL_SCREEN = 2   # Screen frames (protocol.py)
+
+# Send order when several channels have data queued (lower goes first)
+CHANNEL_PRIORITY = (CHANNEL_INPUT, CHANNEL_CONTROL, CHANNEL_SCREEN)
+
+# channel, flags, chunk length
+CHUNK_HEADER = struct.Struct('<BBI')
+
+# Chunk flags
+CHUNK_FINAL = 0x01  # Last chunk of a message
+
+# Largest chunk written at once; bounds how long a higher-priority message waits
+CHUNK_SIZE = 64 * 1024
+
+# Upper bound on a reassembled message, to reject corrupt streams early
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+
+class MuxConnection:
+    """
+    Carries several prioritized message streams over one socket
+
+    A sender thread always writes the next chunk of the highest-priority
+    channel that has data queued. A receiver thread reassembles chunks per
+    channel and hands each complete message to that channel's handler, so
+    handlers must not block for long.
+    """
+
+    def __init__(self, sock, handlers, on_close=None):
+        """
+        Args:
+            sock (socket.socket): Connected socket
+            handlers (dict): Channel -> callable taking a complete message (bytes)
+            on_close (callable): Called once when the connection fails or closes
+        """
+        self.sock = sock
+        self.handlers = handlers
+        self.on_close = on_close
+
+        # Per-channel queues of [memoryview, offset, on_sent callback or None]
+        self.outgoing = {channel: deque() for channel in CHANNEL_PRIORITY}
+        self.condition = threading.Condition()
+
+        self.closed = False
+
+        # Statistics
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def start(self):
+        """Start the sender and receiver threads"""
+        for target in (self._send_loop, self._receive_loop):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def send(self, channel, data, wait=False, on_sent=None):
+        """
+        Queue a message on a channel
+
+        Args:
+            channel (int): CHANNEL_*
+            data (bytes-like): The complete message
+            wait (bool): Block until the whole message has been written
+            on_sent (callable): Called from the sender thread once the whole
+                message has been written or the connection has closed
+                (ignored when wait is set)
+
+        Returns:
+            bool: False if the connection is closed
+        """
+        done = None
+        if wait:
+            done = threading.Event()
+            on_sent = done.set
+
+        with self.condition:
+            if self.closed:
+                return False
+            self.outgoing[channel].append([memoryview(data).cast('B'), 0, on_sent])
+            self.condition.notify()
+
+        if done:
+            done.wait()
+            return not self.closed
+        return True
+
+    def send_json(self, message, wait=False):
+        """Queue a JSON message on the control channel"""
+        return self.send(CHANNEL_CONTROL, json.dumps(message).encode('utf-8'), wait)
+
+    def _next_chunk(self):
+        """Take the next chunk to write, highest priority first (lock held)"""
+        for channel in CHANNEL_PRIORITY:
+            messages = self.outgoing[channel]
+            if messages:
+                entry = messages[0]
+                view, offset, on_sent = entry
+                chunk = view[offset:offset + CHUNK_SIZE]
+                entry[1] = offset + len(chunk)
+
+                final = entry[1] >= len(view)
+                if final:
+                    messages.popleft()
+                return channel, chunk, final, on_sent
+        return None
+
+    def _send_loop(self):
+        """Write queued chunks in priority order"""
+        try:
+            while True:
+                with self.condition:
+                    next_chunk = self._next_chunk()
+                    while next_chunk is None and not self.closed:
+                        self.condition.wait()
+                        next_chunk = self._next_chunk()
+                    if self.closed:
+                        return
+
+                channel, chunk, final, on_sent = next_chunk
+                header = CHUNK_HEADER.pack(channel, CHUNK_FINAL if final else 0, len(chunk))
+                try:
+                    self.sock.sendall(header + chunk)
+                    self.bytes_sent += len(header) + len(chunk)
+                finally:
+                    # The message has left the queue, so its sender is released here even on failure
+                    if final and on_sent:
+                        on_sent()
+        except Exception as e:
+            if not self.closed:
+                logger.error(f"Multiplexed send error: {e}")
+        finally:
+            self.close()
+
+    def _recv_exactly(self, size):
+        """Receive exactly size bytes"""
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:])
+            if not count:
+                raise ConnectionError("Connection closed by peer")
+            received += count
+        self.bytes_received += size
+        return buffer
+
+    def _receive_loop(self):
+        """Reassemble chunks and dispatch complete messages"""
+        partial = {}
+        try:
+            while not self.closed:
+                channel, flags, length = CHUNK_HEADER.unpack(self._recv_exactly(CHUNK_HEADER.size))
+
+                handler = self.handlers.get(channel)
+                if handler is None:
+                    raise ProtocolError(f"Unknown channel: {channel}")
+
+                message = partial.get(channel)
+                if message is None:
+                    message = partial[channel] = bytearray()
+                if len(message) + length > MAX_MESSAGE_SIZE:
+                    raise ProtocolError(f"Message too large on channel {channel}")
+                message += self._recv_exactly(length)
+
+                if flags & CHUNK_FINAL:
+                    del partial[channel]
+                    handler(message)
+        except ConnectionError as e:
+            if not self.closed:
+                logger.info(f"Multiplexed connection ended: {e}")
+        except Exception as e:
+            if not self.closed:
+                logger.error(f"Multiplexed receive error: {e}")
+        finally:
+            self.close()
+
+    def close(self):
+        """Close the connection and release anyone waiting on a send"""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+
+            # Unblock senders waiting for their message to go out
+            for messages in self.outgoing.values():
+                for _, _, on_sent in messages:
+                    if on_sent:
+                        on_sent()
+                messages.clear()
+            self.condition.notify_all()
+
+        # Shut down first so a receive blocked in another thread returns
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except:
+            pass
+        try:
+            self.sock.close()
+        except:
+            pass
+
+        if self.on_close:
+            self.on_close()
@@ -0,0 +1,121 @@
+import struct
+from collections import namedtuple
+
+# Wire format for the screen stream. Every field is little-endian with a fixed
+# size so Windows and Linux peers agree regardless of the native long size.
+#
+#   frame  := FRAME_HEADER tile*            (tile_count tiles, payload_length bytes)
+#   tile   := TILE_HEADER encoded-bytes     (length bytes)
+
+FRAME_MAGIC = b'RCFR'
+PROTOCOL_VERSION = 2
+
+# Codec identifiers (implementations live in frame_codecs.py)
+CODEC_JPEG = 1
+CODEC_PNG = 2
+CODEC_PALETTE = 3
+CODEC_RAW = 4
+
+# Frame flags
+FLAG_KEYFRAME = 0x0001
+FLAG_KEEPALIVE = 0x0002  # No tiles: the screen is unchanged since the last frame
+
+# magic, version, codec, flags, sequence, capture timestamp, width, height, tile count, payload length,
+# ID and injection time (server clock) of the last input event injected before the capture
+FRAME_HEADER = struct.Struct('<4sBBHIdHHHIId')
+
+# x, y, width, height, encoded length
+TILE_HEADER = struct.Struct('<HHHHI')
+
+# Upper bound on a single frame payload, to reject corrupt headers early
+MAX_PAYLOAD_SIZE = 64 * 1024 * 1024
+
+FrameHeader = namedtuple('FrameHeader', [
+    'magic', 'version', 'codec', 'flags', 'sequence', 'timestamp',
+    'width', 'height', 'tile_count', 'payload_length', 'input_id', 'input_time'
+])
+
+
+class ProtocolError(ConnectionError):
+    """Raised when the peer sends data that does not follow the frame protocol"""
+
+
+def pack_frame(sequence, timestamp, width, height, tiles, codec=CODEC_JPEG, flags=0,
+               input_id=0, input_time=0.0):
+    """
+    Build a complete frame message
+
+    Args:
+        sequence (int): Frame sequence number
+        timestamp (float): Capture time (seconds since the epoch)
+        width (int): Full frame width
+        height (int): Full frame height
+        tiles (list): List of (x, y, width, height, encoded buffer)
+        codec (int): Codec identifier shared by all tiles
+        flags (int): Frame flags (FLAG_*)
+        input_id (int): ID of the last input event injected before the capture
+        input_time (float): Time that event was injected (server clock)
+
+    Returns:
+        bytes: Header followed by the tile payload
+    """
+    parts = [None]
+    payload_length = 0
+    for x, y, w, h, encoded in tiles:
+        encoded = memoryview(encoded).cast('B')
+        parts.append(TILE_HEADER.pack(x, y, w, h, encoded.nbytes))
+        parts.append(encoded)
+        payload_length += TILE_HEADER.size + encoded.nbytes
+
+    parts[0] = FRAME_HEADER.pack(
+        FRAME_MAGIC, PROTOCOL_VERSION, codec, flags, sequence & 0xFFFFFFFF,
+        timestamp, width, height, len(tiles), payload_length, input_id & 0xFFFFFFFF, input_time
+    )
+    return b''.join(parts)
+
+
+def unpack_frame_header(data):
+    """
+    Parse and validate a frame header
+
+    Args:
+        data (bytes-like): Exactly FRAME_HEADER.size bytes
+
+    Returns:
+        FrameHeader: The parsed header
+    """
+    header = FrameHeader(*FRAME_HEADER.unpack(data))
+
+    if header.magic != FRAME_MAGIC:
+        raise ProtocolError(f"Bad frame magic: {bytes(header.magic)!r}")
+    if header.version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version: {header.version}")
+    if header.payload_length > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Frame payload too large: {header.payload_length}")
+
+    return header
+
+
+def iter_tiles(payload, tile_count):
+    """
+    Iterate over the tiles in a frame payload without copying
+
+    Args:
+        payload (bytes-like): Frame payload
+        tile_count (int): Number of tiles from the frame header
+
+    Yields:
+        tuple: (x, y, width, height, memoryview of the encoded tile)
+    """
+    view = memoryview(payload)
+    offset = 0
+    for _ in range(tile_count):
+        if offset + TILE_HEADER.size > len(view):
+            raise ProtocolError("Truncated tile header")
+        x, y, w, h, length = TILE_HEADER.unpack_from(view, offset)
+        offset += TILE_HEADER.size
+
+        if offset + length > len(view):
+            raise ProtocolError("Truncated tile data")
+        yield x, y, w, h, view[offset:offset + length]
+        offset += length
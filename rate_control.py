@@ -0,0 +1,200 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger("RateControl")
+
+
+class AdaptiveQualityController:
+    """
+    Adjusts JPEG quality, capture scale and frame rate to hold a target
+    bitrate and per-frame send latency.
+
+    The encoder reports every frame's size with record_frame() and each
+    viewer's sender reports how long each frame was held back by a congested
+    connection with record_send(); a frame is only held back once the
+    viewer's send buffer is past its high-water mark, so below that mark the
+    send time is 0. Viewers that acknowledge frames also report how long
+    each took from send to acknowledgement with record_client_latency(),
+    which covers queueing below the mark, the network and the client's
+    decode and display. Once per evaluation window the controller compares
+    the worst of these latencies and the bitrate against its targets and
+    steps one knob: when over budget it lowers quality first, then scale,
+    then frame rate; when comfortably under budget it restores them in the
+    opposite order.
+    """
+
+    def __init__(self, target_bitrate=10_000_000, target_latency=0.1,
+                 min_quality=30, max_quality=85, quality_step=10,
+                 min_scale=0.5, max_scale=1.0, scale_step=0.125,
+                 min_frame_interval=0.03, max_frame_interval=0.2, frame_interval_step=0.03,
+                 window=0.5):
+        # Targets
+        self.target_bitrate = target_bitrate  # bits per second
+        self.target_latency = target_latency  # seconds per frame send
+
+        # Knob ranges
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.quality_step = quality_step
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.scale_step = scale_step
+        self.min_frame_interval = min_frame_interval
+        self.max_frame_interval = max_frame_interval
+        self.frame_interval_step = frame_interval_step
+
+        # Evaluation window in seconds
+        self.window = window
+
+        # Current settings (quality, scale, frame_interval) are read by the
+        # capture and encode stages and initialised by reset()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Restore full quality and clear measurements (e.g. for a new viewer)"""
+        with self.lock:
+            self.quality = self.max_quality
+            self.scale = self.max_scale
+            self.frame_interval = self.min_frame_interval
+
+            self.window_start = time.time()
+            self.window_bytes = 0
+            self.window_sends = 0
+            self.window_send_time = 0.0
+            self.window_max_send_time = 0.0
+            self.client_latency = None
+
+            self.bitrate = 0.0
+            self.avg_send_time = 0.0
+            self.max_send_time = 0.0
+            self.decisions = 0
+            self.last_decision = "none"
+
+    def record_frame(self, num_bytes):
+        """
+        Record one encoded frame
+
+        Frames are shared between viewers, so the bitrate is measured once
+        per encoded frame rather than once per send.
+
+        Args:
+            num_bytes (int): Size of the frame on the wire
+        """
+        with self.lock:
+            self.window_bytes += num_bytes
+
+            if time.time() - self.window_start >= self.window:
+                self._evaluate()
+
+    def record_send(self, send_time):
+        """
+        Record one frame sent to a viewer
+
+        Args:
+            send_time (float): Seconds this frame waited for the viewer's send buffer to
+                drain below its high-water mark (0 if it was not over the mark)
+        """
+        with self.lock:
+            self.window_sends += 1
+            self.window_send_time += send_time
+            self.window_max_send_time = max(self.window_max_send_time, send_time)
+
+            if time.time() - self.window_start >= self.window:
+                self._evaluate()
+
+    def record_client_latency(self, latency):
+        """
+        Record a frame's delivery latency as measured through the client
+
+        The slowest report in a window counts.
+
+        Args:
+            latency (float): Seconds from sending a frame to the client's acknowledgement of it
+        """
+        with self.lock:
+            if self.client_latency is None:
+                self.client_latency = latency
+            else:
+                self.client_latency = max(self.client_latency, latency)
+
+    def _evaluate(self):
+        """Compare the finished window against the targets and step one knob"""
+        now = time.time()
+        elapsed = max(now - self.window_start, 1e-6)
+
+        self.bitrate = self.window_bytes * 8 / elapsed
+        self.avg_send_time = self.window_send_time / max(self.window_sends, 1)
+        self.max_send_time = self.window_max_send_time
+        latency = self.avg_send_time
+        if self.client_latency is not None:
+            latency = max(latency, self.client_latency)
+
+        over_budget = self.bitrate > self.target_bitrate or latency > self.target_latency
+        under_budget = self.bitrate < self.target_bitrate * 0.6 and latency < self.target_latency * 0.5
+
+        decision = None
+        if over_budget:
+            decision = self._step_down()
+        elif under_budget:
+            decision = self._step_up()
+
+        if decision:
+            self.decisions += 1
+            self.last_decision = decision
+            logger.info(
+                f"{decision}: quality={self.quality} scale={self.scale:.3f} "
+                f"fps={1 / self.frame_interval:.1f} (bitrate={self.bitrate / 1e6:.2f} Mbit/s, "
+                f"latency={latency * 1000:.0f} ms)"
+            )
+
+        # Start the next window
+        self.window_start = now
+        self.window_bytes = 0
+        self.window_sends = 0
+        self.window_send_time = 0.0
+        self.window_max_send_time = 0.0
+        self.client_latency = None
+
+    def _step_down(self):
+        """Reduce cost: quality first, then scale, then frame rate"""
+        if self.quality > self.min_quality:
+            self.quality = max(self.min_quality, self.quality - self.quality_step)
+            return "lower quality"
+        if self.scale > self.min_scale:
+            self.scale = max(self.min_scale, self.scale - self.scale_step)
+            return "lower scale"
+        if self.frame_interval < self.max_frame_interval:
+            self.frame_interval = min(self.max_frame_interval, self.frame_interval + self.frame_interval_step)
+            return "lower frame rate"
+        return None
+
+    def _step_up(self):
+        """Restore cost: frame rate first, then scale, then quality"""
+        if self.frame_interval > self.min_frame_interval:
+            self.frame_interval = max(self.min_frame_interval, self.frame_interval - self.frame_interval_step)
+            return "raise frame rate"
+        if self.scale < self.max_scale:
+            self.scale = min(self.max_scale, self.scale + self.scale_step)
+            return "raise scale"
+        if self.quality < self.max_quality:
+            self.quality = min(self.max_quality, self.quality + self.quality_step)
+            return "raise quality"
+        return None
+
+    def get_stats(self):
+        """Get the current settings and the measurements behind them"""
+        with self.lock:
+            return {
+                'quality': self.quality,
+                'scale': self.scale,
+                'fps': 1 / self.frame_interval,
+                'bitrate': self.bitrate,
+                'target_bitrate': self.target_bitrate,
+                'avg_send_time': self.avg_send_time,
+                'max_send_time': self.max_send_time,
+                'target_latency': self.target_latency,
+                'decisions': self.decisions,
+                'last_decision': self.last_decision
+            }
@@ -1,15 +1,24 @@
 import cv2
 import numpy as np
 import socket
-import pickle
-import struct
 import threading
 import time
+import os
+from concurrent.futures import ThreadPoolExecutor
 import traceback
 import json
 import logging
 from pynput.mouse import Listener as MouseListener, Button as MouseButton
 from pynput.keyboard import Listener as KeyboardListener, Key
+from screen_tiles import composite_tiles
+from frame_codecs import DEFAULT_CODEC, DECODE_REDUCTIONS, get_codec, get_codec_names
+from input_protocol import (
+    INPUT_EVENT, MAX_INPUT_BATCH, EVENT_MOVE, EVENT_CLICK, EVENT_SCROLL, EVENT_KEY_PRESS, EVENT_KEY_RELEASE,
+    BUTTON_NONE, BUTTON_LEFT, BUTTON_RIGHT, VK_KEY_BASE, build_key_codes, pack_input_batch
+)
+from latency import InputLatencyTracker
+from mux import MuxConnection, CHANNEL_CONTROL, CHANNEL_INPUT, CHANNEL_SCREEN
+from protocol import FRAME_HEADER, FLAG_KEYFRAME, FLAG_KEEPALIVE, PROTOCOL_VERSION, unpack_frame_header, iter_tiles
 
 # Configure logging
 logging.basicConfig(
@@ -22,14 +31,376 @@ logging.basicConfig(
 )
 logger = logging.getLogger("RemoteClient")
 
+# Requested kernel receive buffer for the screen socket
+SCREEN_RECV_BUFFER = 4 * 1024 * 1024
+
+# A screen connection that delivers nothing for this long is presumed dead; the
+# server sends keep-alives on a static screen, so only a silent drop gets here
+SCREEN_RECEIVE_TIMEOUT = 3.0
+
+# Delay before the second reconnect attempt after a dropped connection (the
+# first is immediate); doubles per failed attempt up to RECONNECT_MAX_DELAY
+RECONNECT_INITIAL_DELAY = 0.1
+RECONNECT_MAX_DELAY = 2.0
+
+
+class FrameReceiver:
+    """
+    Reads frames from the screen socket into a small pool of reusable buffers
+    
+    Data is received with recv_into in chunks as large as the kernel's
+    receive buffer. Complete frames are returned as memoryviews into the
+    buffer, so nothing is copied or concatenated per packet. Returned frames
+    can be handed to another thread as they are: bytes of a frame are never
+    overwritten until it has been given back with release(). Once a buffer
+    has no room left, the partial frame moves to the front if every frame in
+    the buffer has been released, and otherwise to a pooled buffer; the old
+    one rejoins the pool when its last frame is released.
+    """
+    
+    def __init__(self, sock, initial_size=1024 * 1024, pool_size=2):
+        self.sock = sock
+        
+        # Read as much per call as the kernel can have buffered
+        try:
+            self.recv_size = max(65536, sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+        except OSError:
+            self.recv_size = 65536
+        
+        self.buffer = bytearray(max(initial_size, 2 * self.recv_size))
+        self.view = memoryview(self.buffer)
+        
+        # Unconsumed data lives in buffer[start:end]
+        self.start = 0
+        self.end = 0
+        
+        # Frames returned but not yet released, per buffer (by id); buffers no longer
+        # read into that wait for their last frame; and released buffers ready for reuse
+        self.lock = threading.Lock()
+        self.outstanding = {}
+        self.retired = {}
+        self.free = []
+        self.pool_size = pool_size
+    
+    def _reserve(self, needed):
+        """Make room for `needed` unconsumed bytes plus one full-size read"""
+        if len(self.buffer) - self.start >= needed + self.recv_size:
+            return
+        
+        size = len(self.buffer)
+        available = self.end - self.start
+        
+        with self.lock:
+            in_use = self.outstanding.get(id(self.buffer), 0)
+        if size >= needed + self.recv_size and not in_use:
+            # Nothing in this buffer is still in use, so move the partial frame to the front
+            self.view[:available] = self.view[self.start:self.end]
+        else:
+            if size < needed + self.recv_size:
+                # Grow for an unusually large frame
+                size = max(2 * size, needed + self.recv_size)
+            
+            # The decoder still holds frames from this buffer; continue in another one
+            new_buffer = self._take_buffer(size)
+            new_buffer[:available] = self.view[self.start:self.end]
+            self._retire(self.buffer)
+            self.buffer = new_buffer
+            self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = available
+    
+    def _take_buffer(self, size):
+        """Get a pooled buffer of at least size bytes, allocating only when none is free"""
+        with self.lock:
+            for index, buffer in enumerate(self.free):
+                if len(buffer) >= size:
+                    return self.free.pop(index)
+        return bytearray(size)
+    
+    def _retire(self, buffer):
+        """Stop reading into a buffer; it is pooled once all its frames are released"""
+        with self.lock:
+            if self.outstanding.get(id(buffer)):
+                self.retired[id(buffer)] = buffer
+            else:
+                self._recycle(buffer)
+    
+    def _recycle(self, buffer):
+        """Return a buffer without frames in use to the pool (lock held)"""
+        self.outstanding.pop(id(buffer), None)
+        if len(self.free) < self.pool_size:
+            self.free.append(buffer)
+    
+    def release(self, payload):
+        """Give back a payload returned by read_frame once nothing uses it any more"""
+        key = id(payload.obj)
+        with self.lock:
+            count = self.outstanding.get(key, 0) - 1
+            if count > 0:
+                self.outstanding[key] = count
+                return
+            self.outstanding.pop(key, None)
+            buffer = self.retired.pop(key, None)
+            if buffer is not None:
+                self._recycle(buffer)
+    
+    def _fill(self, needed):
+        """Receive until at least `needed` unconsumed bytes are buffered"""
+        if self.end - self.start >= needed:
+            return
+        
+        self._reserve(needed)
+        while self.end - self.start < needed:
+            received = self.sock.recv_into(self.view[self.end:])
+            if not received:
+                raise ConnectionError("Connection closed by server")
+            self.end += received
+    
+    def read_frame(self):
+        """
+        Receive the next complete frame
+        
+        Returns:
+            tuple: (FrameHeader, memoryview of the payload), the view staying
+            valid until it is passed to release()
+        """
+        self._fill(FRAME_HEADER.size)
+        header = unpack_frame_header(self.view[self.start:self.start + FRAME_HEADER.size])
+        
+        frame_size = FRAME_HEADER.size + header.payload_length
+        self._fill(frame_size)
+        
+        payload = self.view[self.start + FRAME_HEADER.size:self.start + frame_size]
+        self.start += frame_size
+        
+        with self.lock:
+            key = id(self.buffer)
+            self.outstanding[key] = self.outstanding.get(key, 0) + 1
+        return header, payload
+
+
+class FrameMailbox:
+    """
+    Hand-off between the screen receiver and decoder threads
+    
+    The receiver posts every frame as it arrives and never waits for the
+    decoder; the decoder takes everything pending in one go. A keyframe
+    supersedes whatever is still pending and a keep-alive adds nothing new,
+    so a decoder that falls behind skips to the newest state instead of
+    working through a backlog. Deltas cannot be skipped individually: if too
+    many pile up they are discarded and the mailbox holds off until the next
+    keyframe, which the receiver then requests from the server.
+    
+    Payloads that came from a FrameReceiver go back to it through `release`,
+    both for frames discarded here and for frames the decoder is done with.
+    """
+    
+    def __init__(self, max_pending=8, release=None):
+        self.max_pending = max_pending
+        self.release_payload = release
+        self.pending = []
+        self.waiting_for_keyframe = False
+        self.closed = False
+        self.dropped_frames = 0
+        self.condition = threading.Condition()
+    
+    def put(self, header, payload):
+        """
+        Post a received frame
+        
+        Returns:
+            bool: True if the backlog was discarded and a keyframe is needed
+        """
+        with self.condition:
+            if header.flags & FLAG_KEYFRAME:
+                self.dropped_frames += len(self.pending)
+                self.release(self.pending)
+                self.pending = [(header, payload)]
+                self.waiting_for_keyframe = False
+            elif self.waiting_for_keyframe or (header.flags & FLAG_KEEPALIVE and self.pending):
+                self.dropped_frames += 1
+                self.release([(header, payload)])
+                return False
+            elif len(self.pending) >= self.max_pending:
+                self.dropped_frames += len(self.pending) + 1
+                self.release(self.pending + [(header, payload)])
+                self.pending = []
+                self.waiting_for_keyframe = True
+                return True
+            else:
+                self.pending.append((header, payload))
+            
+            self.condition.notify()
+            return False
+    
+    def take(self, timeout=None):
+        """
+        Take all pending frames, waiting up to timeout for one to arrive
+        
+        Returns:
+            list: (header, payload) pairs in arrival order (possibly empty),
+            or None once the receiver has stopped
+        """
+        with self.condition:
+            if not self.pending and not self.closed:
+                self.condition.wait(timeout)
+            if self.closed:
+                return None
+            
+            frames, self.pending = self.pending, []
+            return frames
+    
+    def release(self, frames):
+        """Hand back the payloads of frames that are no longer needed"""
+        if self.release_payload:
+            for _, payload in frames:
+                self.release_payload(payload)
+    
+    def close(self):
+        """Wake the decoder and tell it no more frames will arrive"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class InputSender:
+    """
+    Sends input events to the server in batches, coalescing pointer moves
+    
+    The listener threads only queue events and never wait on the network; a
+    flush thread sends whatever is queued as one batch. Pointer moves only
+    record the newest position, which is sent at most move_rate times per
+    second and mapped to server coordinates only then. Clicks, scrolls and
+    key events are flushed immediately, after any move that preceded them,
+    so the server sees everything in the order it happened.
+    """
+    
+    def __init__(self, send, scale, move_rate=120, latency_tracker=None):
+        self.send = send      # callable that writes bytes to the input socket
+        self.scale = scale    # callable mapping local to server coordinates
+        self.move_interval = 1.0 / move_rate
+        
+        # Events are numbered in send order; frames echo the last one injected
+        self.latency_tracker = latency_tracker
+        self.next_event_id = 1
+        
+        # Packed events waiting to be sent, oldest first
+        self.pending_events = []
+        
+        # Newest unsent pointer position as (x, y, timestamp); always newer than pending_events
+        self.pending_move = None
+        self.last_move_time = 0.0
+        
+        # Statistics
+        self.moves_received = 0
+        self.moves_sent = 0
+        self.batches_sent = 0
+        
+        # Guards the pending events; only the flush thread sends, which keeps them in order
+        self.condition = threading.Condition()
+        self.running = True
+        
+        self.thread = threading.Thread(target=self.flush_loop)
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def move(self, x, y):
+        """Record a pointer move in local coordinates"""
+        with self.condition:
+            if self.pending_move is None:
+                self.condition.notify()
+            self.pending_move = (x, y, time.time())
+            self.moves_received += 1
+    
+    def send_event(self, event_type, x=0, y=0, button=BUTTON_NONE, key=0):
+        """Queue a non-move event to be sent right away, after any pending move"""
+        with self.condition:
+            self._take_move()
+            self._queue_event(event_type, button, key, x, y, time.time())
+            self.condition.notify()
+    
+    def _queue_event(self, event_type, button, key, x, y, timestamp):
+        """Number, pack and queue one event (lock held)"""
+        event_id = self.next_event_id
+        self.next_event_id += 1
+        self.pending_events.append(INPUT_EVENT.pack(event_type, button, event_id, key, x, y, timestamp))
+        
+        if self.latency_tracker:
+            self.latency_tracker.record_sent(event_id, timestamp)
+    
+    def _take_move(self):
+        """Move the pending pointer position into the event queue (dropped if outside the remote screen)"""
+        if self.pending_move is None:
+            return
+        
+        x, y, timestamp = self.pending_move
+        self.pending_move = None
+        self.last_move_time = time.time()
+        
+        server_x, server_y = self.scale(x, y)
+        if server_x is None or server_y is None:
+            return
+        
+        self.moves_sent += 1
+        self._queue_event(EVENT_MOVE, BUTTON_NONE, 0, server_x, server_y, timestamp)
+    
+    def flush_loop(self):
+        """Send queued events, and the pending move whenever one is due"""
+        while True:
+            with self.condition:
+                while self.running:
+                    if self.pending_events:
+                        # A pending move is newer than the queued events, so it can ride along
+                        self._take_move()
+                        break
+                    
+                    if self.pending_move is None:
+                        self.condition.wait()
+                        continue
+                    
+                    # Hold a lone move back until the rate limit allows another
+                    delay = self.last_move_time + self.move_interval - time.time()
+                    if delay > 0:
+                        self.condition.wait(delay)
+                        continue
+                    
+                    self._take_move()
+                    if self.pending_events:
+                        break
+                
+                if not self.running:
+                    return
+                
+                events = self.pending_events[:MAX_INPUT_BATCH]
+                del self.pending_events[:MAX_INPUT_BATCH]
+            
+            # Send outside the lock so the listeners never wait on the network
+            self.send(pack_input_batch(events))
+            self.batches_sent += 1
+    
+    def stop(self):
+        """Stop the flush thread, dropping anything not yet sent"""
+        with self.condition:
+            self.running = False
+            self.pending_events = []
+            self.pending_move = None
+            self.condition.notify()
+
+
 class RemoteControlClient:
     """Client for remote control with authentication"""
     
-    def __init__(self, server_ip='127.0.0.1', screen_port=5000, mouse_port=5001, auth_client=None):
+    def __init__(self, server_ip='127.0.0.1', screen_port=5000, mouse_port=5001, auth_client=None,
+                 mouse_move_rate=120, multiplex=False, mux_port=5003):
         self.server_ip = server_ip
         self.screen_port = screen_port
         self.mouse_port = mouse_port
         
+        # Optionally run screen, input and control over one prioritized connection (mux.py)
+        self.multiplex = multiplex
+        self.mux_port = mux_port
+        self.mux = None
+        
         # Authentication client
         self.auth_client = auth_client
         
@@ -41,11 +412,34 @@ class RemoteControlClient:
         
         # Initialize screen sharing socket
         self.screen_socket = None
+        self.screen_connected = False
+        
+        # Single-use ticket from the server for resuming the screen session after a
+        # dropped connection, and how long after the drop it stays valid
+        self.resume_ticket = None
+        self.resume_lifetime = 0
+        
+        # Serializes control messages sent back on the screen socket
+        self.screen_send_lock = threading.Lock()
+        
+        # Frame display size declared to the server so it encodes at display resolution
+        self.viewport_size = None
+        
+        # Preferred codec and the codecs the server offered at handshake
+        self.codec_name = DEFAULT_CODEC
+        self.server_codecs = []
         
         # Initialize mouse control socket
         self.mouse_socket = None
         self.mouse_connected = False
         
+        # Input events go through a sender that coalesces pointer moves to mouse_move_rate per second
+        self.mouse_move_rate = mouse_move_rate
+        self.input_sender = None
+        
+        # Input-to-inject and input-to-photon latency, matched up through the frame headers
+        self.input_latency = InputLatencyTracker()
+        
         # Scale factor for screen resolution differences
         self.scale_x = 1.0
         self.scale_y = 1.0
@@ -62,12 +456,20 @@ class RemoteControlClient:
         # GUI window information for better coordinate scaling
         self.gui_window_info = None
         
+        # Screen rect the remote frame is displayed in, and the cached mapping from
+        # client screen to server coordinates derived from it (see update_input_transform)
+        self.input_geometry = None
+        self.input_transform = None
+        
         # UI correction factor for the window title bar
         self.ui_offset_y = -25
         
-        # Track pressed keys to prevent repeats
+        # Track pressed keys (by key code) to prevent repeats
         self.pressed_keys = set()
         
+        # Wire codes for named keys, built once
+        self.key_codes = build_key_codes(Key)
+        
         # Add a lock for the pressed_keys set
         self.keys_lock = threading.Lock()
         
@@ -75,8 +477,22 @@ class RemoteControlClient:
         self.mouse_listener = None
         self.keyboard_listener = None
         
-        # Latest frame received
+        # Latest decoded frame, published by the decode loop under frame_lock
         self.latest_frame = None
+        self.frame_count = 0
+        self.frame_lock = threading.Lock()
+        
+        # Persistent framebuffer that delta tiles are composited into
+        self.framebuffer = None
+        
+        # Remote frame size the framebuffer holds, and the factor it is decoded down by
+        # when the display is smaller than the remote frame
+        self.framebuffer_size = None
+        self.decode_reduction = 1
+        self.reduction_keyframe_requested = False
+        
+        # Multi-part frames (strips or tiles) are decoded in parallel; OpenCV releases the GIL
+        self.decode_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
         
         # Callback for frame updates
         self.frame_callback = None
@@ -90,7 +506,15 @@ class RemoteControlClient:
         logger.info(f"Remote control client initialized for server {server_ip}")
     
     def start(self, frame_callback=None):
-        """Start the client with threads for screen sharing and mouse control"""
+        """
+        Start the client with threads for screen sharing and mouse control
+        
+        Args:
+            frame_callback (callable): Called from the decode thread with the
+                sequence number of each new frame; fetch the frame itself with
+                get_latest_frame_with_sequence(). Without a callback frames are
+                shown in an OpenCV window.
+        """
         if not self.auth_client or not self.auth_client.is_authenticated():
             logger.error("Authentication required before starting remote control")
             return False
@@ -98,6 +522,13 @@ class RemoteControlClient:
         # Set frame callback
         self.frame_callback = frame_callback
         
+        # Single-connection mode: one thread runs the whole session
+        if self.multiplex:
+            session_thread = threading.Thread(target=self.handle_mux_session)
+            session_thread.daemon = True
+            session_thread.start()
+            return True
+        
         # Create and start mouse control thread
         mouse_thread = threading.Thread(target=self.setup_mouse_control)
         mouse_thread.daemon = True
@@ -125,7 +556,13 @@ class RemoteControlClient:
         if self.keyboard_listener:
             self.keyboard_listener.stop()
         
+        if self.input_sender:
+            self.input_sender.stop()
+        
         # Close sockets
+        if self.mux:
+            self.mux.close()
+        
         if self.screen_socket:
             try:
                 self.screen_socket.close()
@@ -138,16 +575,77 @@ class RemoteControlClient:
             except:
                 pass
         
+        # Stop the decode workers
+        self.decode_pool.shutdown(wait=False)
+        
         # Close any open windows
         cv2.destroyAllWindows()
         
         logger.info("Remote control client stopped")
     
     def handle_screen_sharing(self):
-        """Handle receiving screen shares from the server"""
+        """Handle receiving screen shares from the server, reconnecting after a drop"""
+        try:
+            self.run_with_reconnect(self.run_screen_connection)
+        finally:
+            if not self.frame_callback:
+                cv2.destroyAllWindows()
+            self.running = False
+    
+    def run_with_reconnect(self, run_connection):
+        """
+        Run connections until the client stops or a dropped session can no longer be resumed
+        
+        The first reconnect attempt after a drop is immediate, later ones back
+        off from RECONNECT_INITIAL_DELAY to RECONNECT_MAX_DELAY. Attempts
+        present the server's resume ticket, so the session reattaches without
+        logging in again; they stop once the ticket would have expired.
+        
+        Args:
+            run_connection (callable): Runs one connection until it ends and
+                returns True if the session was established on it
+        """
+        deadline = None
+        delay = RECONNECT_INITIAL_DELAY
+        while self.running:
+            if run_connection():
+                # Dropped after a working session: start over with a fresh backoff
+                if not self.running:
+                    break
+                deadline = time.time() + self.resume_lifetime
+                delay = RECONNECT_INITIAL_DELAY
+                logger.info(f"Connection lost, reconnecting for up to {self.resume_lifetime}s")
+                self.show_status("Connection lost - reconnecting...")
+                continue
+            
+            # The first connection failed, or the session can no longer be resumed
+            if deadline is None or time.time() + delay > deadline:
+                break
+            
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+    
+    def run_screen_connection(self):
+        """
+        Run one screen sharing connection until it ends
+        
+        Returns:
+            bool: True if the session was established on this connection
+        """
+        established = False
         try:
             # Create socket
             self.screen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            
+            # Ask for a large kernel receive buffer so whole frames can arrive between reads
+            try:
+                self.screen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SCREEN_RECV_BUFFER)
+            except OSError as e:
+                logger.debug(f"Could not set screen socket receive buffer: {e}")
+            
+            # Bounds the connect too, and turns a silent drop into a timeout error
+            self.screen_socket.settimeout(SCREEN_RECEIVE_TIMEOUT)
+            
             logger.info(f"Connecting to screen sharing server at {self.server_ip}:{self.screen_port}...")
             self.screen_socket.connect((self.server_ip, self.screen_port))
             logger.info("Connected to screen sharing server")
@@ -155,162 +653,428 @@ class RemoteControlClient:
             # Authenticate with screen server
             if not self.auth_client or not self.auth_client.is_authenticated():
                 logger.error("Authentication required for screen sharing")
-                return
+                return established
             
-            # Send authentication token
-            token = self.auth_client.get_token()
+            # Send the resume ticket if the last connection left us one, else the token
+            resume_ticket = self.resume_ticket
+            token = resume_ticket or self.auth_client.get_token()
             token_bytes = token.encode('utf-8')
             token_length = len(token_bytes).to_bytes(4, byteorder='big')
             self.screen_socket.sendall(token_length + token_bytes)
             
-            # Receive authentication response
+            # Receive authentication response; the ticket is used up either way
             auth_response = self.receive_json_response(self.screen_socket)
+            self.resume_ticket = None
             
             if not auth_response.get('success'):
+                if resume_ticket:
+                    # Expired or unknown ticket: the next attempt uses the token
+                    raise ConnectionError(f"Screen session could not be resumed: {auth_response.get('message')}")
                 logger.error(f"Screen authentication failed: {auth_response.get('message')}")
-                return
-            
-            logger.info("Screen authentication successful")
+                return established
             
-            # Receive monitor information
-            data = b""
-            payload_size = struct.calcsize("L")
+            logger.info("Screen session resumed" if resume_ticket else "Screen authentication successful")
             
             # First message is the server's monitor information
-            while len(data) < payload_size:
-                packet = self.screen_socket.recv(4096)
-                if not packet:
-                    raise ConnectionError("Connection closed by server")
-                data += packet
-            
-            packed_msg_size = data[:payload_size]
-            data = data[payload_size:]
-            msg_size = struct.unpack("L", packed_msg_size)[0]
-            
-            # Receive monitor info data
-            while len(data) < msg_size:
-                packet = self.screen_socket.recv(4096)
-                if not packet:
-                    raise ConnectionError("Connection closed by server")
-                data += packet
-            
-            monitor_info_data = data[:msg_size]
-            data = data[msg_size:]
-            
-            # Deserialize monitor info
-            monitor_info = pickle.loads(monitor_info_data)
-            self.server_width = monitor_info['width']
-            self.server_height = monitor_info['height']
-            self.server_aspect_ratio = self.server_width / self.server_height
-            logger.info(f"Server monitor dimensions: {self.server_width}x{self.server_height}, aspect ratio: {self.server_aspect_ratio:.2f}")
-            
-            # Display initial keyboard mode
-            self.show_status("TYPING MODE - Press Tab to enter command mode", 5.0)
-            
-            # Main loop for receiving frames
-            while self.running:
-                try:
-                    # Receive message size
-                    while len(data) < payload_size:
-                        packet = self.screen_socket.recv(4096)
-                        if not packet:
-                            raise ConnectionError("Connection closed by server")
-                        data += packet
-                    
-                    packed_msg_size = data[:payload_size]
-                    data = data[payload_size:]
-                    msg_size = struct.unpack("L", packed_msg_size)[0]
-                    
-                    # Receive frame data
-                    while len(data) < msg_size:
-                        packet = self.screen_socket.recv(4096)
-                        if not packet:
-                            raise ConnectionError("Connection closed by server")
-                        data += packet
-                    
-                    frame_data = data[:msg_size]
-                    data = data[msg_size:]
-                    
-                    # Deserialize and display frame
-                    encoded_frame = pickle.loads(frame_data)
-                    frame = cv2.imdecode(encoded_frame, cv2.IMREAD_COLOR)
-                    
-                    # Store the latest frame
-                    self.latest_frame = frame.copy()
-                    display_frame = frame.copy()  # Make a copy for status display
-                    
-                    # Display status message if needed
-                    current_time = time.time()
-                    if current_time < self.status_display_time:
-                        # Add status message overlay to frame
-                        font = cv2.FONT_HERSHEY_SIMPLEX
-                        # Add a dark background behind the text for better visibility
-                        text_size = cv2.getTextSize(self.status_message, font, 1, 2)[0]
-                        cv2.rectangle(display_frame, (15, 15), (25 + text_size[0], 60), (0, 0, 0), -1)
-                        cv2.putText(display_frame, self.status_message, (20, 50), font, 1, (0, 255, 0), 2, cv2.LINE_AA)
-                    
-                    # If a callback is provided, call it with the frame
-                    if self.frame_callback:
-                        self.frame_callback(display_frame)
-                    else:
-                        # Display the frame in a named window
-                        cv2.imshow('Remote Screen', display_frame)
-                        
-                        # Update window dimensions for accurate scaling
-                        window_rect = cv2.getWindowImageRect('Remote Screen')
-                        if window_rect is not None and window_rect[2] > 0 and window_rect[3] > 0:
-                            self.window_width = window_rect[2]
-                            self.window_height = window_rect[3]
-                            
-                            # Update scaling factors
-                            self.scale_x = self.server_width / self.window_width
-                            self.scale_y = self.server_height / self.window_height
-                        
-                        # Check for key presses
-                        key = cv2.waitKey(1) & 0xFF
-                        
-                        # Handle keyboard mode toggle with Tab key (ASCII 9)
-                        if key == 9:  # Tab key
-                            self.toggle_keyboard_mode()
-                        elif self.keyboard_mode == "command":
-                            # In command mode, handle special keys
-                            if key == ord('q'):  # 'q' to quit
-                                self.show_status("Disconnecting...")
-                                logger.info("Received quit command, disconnecting")
-                                self.running = False
-                                break
-                            elif key == ord('c'):  # 'c' to toggle control
-                                self.control_enabled = not self.control_enabled
-                                status = "enabled" if self.control_enabled else "disabled"
-                                self.show_status(f"Control {status}")
-                                logger.info(f"Mouse and keyboard control {status}")
-                            elif key == ord('u'):  # 'u' to adjust mouse position DOWN
-                                self.ui_offset_y -= 5
-                                self.show_status(f"Y offset: {self.ui_offset_y}")
-                                logger.info(f"UI offset Y changed to {self.ui_offset_y}")
-                            elif key == ord('d'):  # 'd' to adjust mouse position UP
-                                self.ui_offset_y += 5
-                                self.show_status(f"Y offset: {self.ui_offset_y}")
-                                logger.info(f"UI offset Y changed to {self.ui_offset_y}")
-                        
-                except ConnectionError as e:
-                    logger.error(f"Screen sharing connection error: {e}")
-                    break
-                except Exception as e:
-                    logger.error(f"Screen sharing error: {e}")
-                    traceback.print_exc()
-                    continue
+            self.apply_monitor_info(self.receive_json_response(self.screen_socket))
+            
+            # The screen socket is ready for control messages
+            self.screen_connected = True
+            established = True
+            self.negotiate_stream()
+            
+            # A separate receiver thread only frames bytes off the socket, so a
+            # slow decode or repaint never backs up the TCP stream
+            receiver = FrameReceiver(self.screen_socket)
+            mailbox = FrameMailbox(release=receiver.release)
+            receive_thread = threading.Thread(
+                target=self.receive_frames,
+                args=(receiver, mailbox)
+            )
+            receive_thread.daemon = True
+            receive_thread.start()
             
+            self.run_decode_loop(mailbox)
+            
+        except OSError as e:
+            # Refused, reset or timed out; the caller decides whether to retry
+            logger.warning(f"Screen sharing connection failed: {e}")
         except Exception as e:
             logger.error(f"Screen sharing connection failed: {e}")
             traceback.print_exc()
         finally:
+            self.screen_connected = False
             if self.screen_socket:
                 self.screen_socket.close()
+        return established
+    
+    def handle_mux_session(self):
+        """Run screen sharing, input and control over one multiplexed connection, reconnecting after a drop"""
+        try:
+            self.run_with_reconnect(self.run_mux_connection)
+        finally:
             if not self.frame_callback:
                 cv2.destroyAllWindows()
             self.running = False
     
+    def run_mux_connection(self):
+        """
+        Run one multiplexed connection until it ends
+        
+        Returns:
+            bool: True if the session was established on this connection
+        """
+        established = False
+        mailbox = FrameMailbox()
+        welcome_received = threading.Event()
+        welcome = {}
+        
+        def on_control(message):
+            message = json.loads(message.decode('utf-8'))
+            if message.get('type') == 'welcome':
+                welcome.update(message)
+                welcome_received.set()
+            else:
+                logger.warning(f"Unknown control message: {message.get('type')}")
+        
+        def on_screen(message):
+            view = memoryview(message)
+            header = unpack_frame_header(view[:FRAME_HEADER.size])
+            self.input_latency.record_clock_sample(header.timestamp, time.time())
+            
+            # Each message is its own buffer, so the payload can be posted without a copy
+            if mailbox.put(header, view[FRAME_HEADER.size:FRAME_HEADER.size + header.payload_length]):
+                logger.warning("Decoder fell behind, requesting a keyframe")
+                self.send_screen_control({'type': 'keyframe'})
+        
+        def on_close():
+            self.screen_connected = False
+            self.mouse_connected = False
+            welcome_received.set()
+            mailbox.close()
+        
+        try:
+            if not self.auth_client or not self.auth_client.is_authenticated():
+                logger.error("Authentication required for remote control")
+                return
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SCREEN_RECV_BUFFER)
+            except OSError as e:
+                logger.debug(f"Could not set receive buffer: {e}")
+            
+            # Bounds the connect too, and turns a silent drop into a timeout error
+            sock.settimeout(SCREEN_RECEIVE_TIMEOUT)
+            
+            logger.info(f"Connecting to multiplexed server at {self.server_ip}:{self.mux_port}...")
+            sock.connect((self.server_ip, self.mux_port))
+            
+            # Small input chunks must not wait for Nagle behind screen data
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            
+            self.mux = MuxConnection(sock, {
+                CHANNEL_CONTROL: on_control,
+                CHANNEL_SCREEN: on_screen
+            }, on_close=on_close)
+            self.mux.start()
+            
+            # Authenticate, resuming the last session if we hold a ticket for it;
+            # the welcome carries the monitor information
+            hello = {'type': 'hello', 'token': self.auth_client.get_token()}
+            if self.resume_ticket:
+                hello['resume_ticket'] = self.resume_ticket
+            self.mux.send_json(hello)
+            
+            # The ticket is used up either way
+            received = welcome_received.wait(10)
+            self.resume_ticket = None
+            if not received or not welcome.get('success'):
+                raise ConnectionError(f"Authentication failed: {welcome.get('message', 'no response')}")
+            
+            logger.info("Multiplexed session established")
+            self.apply_monitor_info(welcome)
+            
+            self.screen_connected = True
+            self.mouse_connected = True
+            established = True
+            self.start_input_listeners()
+            self.negotiate_stream()
+            
+            self.run_decode_loop(mailbox)
+            
+        except OSError as e:
+            # Refused, reset, timed out or rejected; the caller decides whether to retry
+            logger.warning(f"Multiplexed session failed: {e}")
+        except Exception as e:
+            logger.error(f"Multiplexed session failed: {e}")
+            traceback.print_exc()
+        finally:
+            self.screen_connected = False
+            self.mouse_connected = False
+            if self.mux:
+                self.mux.close()
+        return established
+    
+    def apply_monitor_info(self, monitor_info):
+        """Take the server's monitor size and codecs from the handshake"""
+        if 'width' not in monitor_info:
+            raise ConnectionError(f"No monitor information received: {monitor_info.get('message')}")
+        if monitor_info.get('protocol_version') != PROTOCOL_VERSION:
+            raise ConnectionError(f"Unsupported server protocol version: {monitor_info.get('protocol_version')}")
+        
+        self.server_width = monitor_info['width']
+        self.server_height = monitor_info['height']
+        self.server_codecs = monitor_info.get('codecs', [DEFAULT_CODEC])
+        self.server_aspect_ratio = self.server_width / self.server_height
+        self.update_input_transform()
+        
+        # Ticket for resuming this session if the connection drops
+        self.resume_ticket = monitor_info.get('resume_ticket')
+        self.resume_lifetime = monitor_info.get('resume_lifetime', 0)
+        logger.info(f"Server monitor dimensions: {self.server_width}x{self.server_height}, aspect ratio: {self.server_aspect_ratio:.2f}")
+        
+        # The server starts every connection with a keyframe
+        self.framebuffer = None
+    
+    def negotiate_stream(self):
+        """Declare the viewport if known and negotiate the codec"""
+        if self.viewport_size:
+            self.send_viewport_size()
+        
+        # Fall back to the default codec if the server lacks ours
+        if self.codec_name not in self.server_codecs:
+            logger.warning(f"Server does not offer codec {self.codec_name}, using {DEFAULT_CODEC}")
+            self.codec_name = DEFAULT_CODEC
+        self.send_screen_control({'type': 'codec', 'name': self.codec_name})
+    
+    def run_decode_loop(self, mailbox):
+        """Decode and display frames posted to the mailbox until the connection ends"""
+        # Display initial keyboard mode
+        self.show_status("TYPING MODE - Press Tab to enter command mode", 5.0)
+        
+        # Decode loop: take everything the receiver posted since the last pass
+        while self.running:
+            try:
+                frames = mailbox.take(timeout=0.5)
+                if frames is None:
+                    raise ConnectionError("Screen receiver stopped")
+                
+                # Composite every pending frame's tiles into the framebuffer,
+                # but only display the result once
+                frame = None
+                changed = False
+                try:
+                    for header, frame_data in frames:
+                        frame = self.composite_frame(header, frame_data)
+                        changed = changed or not header.flags & FLAG_KEEPALIVE
+                finally:
+                    # The payloads are decoded into the framebuffer; their receive buffer can be reused
+                    mailbox.release(frames)
+                if frame is None:
+                    self.acknowledge_frames(frames)
+                    continue
+                
+                # Publish the frame only if it changed (keep-alives repeat the last one);
+                # the snapshot is never modified afterwards
+                if changed or self.latest_frame is None:
+                    snapshot = frame.copy()
+                    with self.frame_lock:
+                        self.latest_frame = snapshot
+                        self.frame_count += 1
+                        sequence = self.frame_count
+                    
+                    # GUI mode: notify once per new frame; the GUI fetches the
+                    # frame itself and paints its own overlays
+                    if self.frame_callback:
+                        self.frame_callback(sequence)
+                
+                # Input events these frames reflect have now reached the display
+                display_time = time.time()
+                for header, _ in frames:
+                    self.input_latency.record_frame(
+                        header.input_id, header.input_time,
+                        not header.flags & FLAG_KEEPALIVE, display_time
+                    )
+                
+                # Without a GUI, show the frame in an OpenCV window on this thread.
+                # The GUI repaints on its own thread and skips frames it falls
+                # behind on, so frames are acknowledged once handed to it.
+                if self.frame_callback:
+                    self.acknowledge_frames(frames)
+                    continue
+                
+                display_frame = self.latest_frame
+                
+                # Display status message if needed
+                current_time = time.time()
+                if current_time < self.status_display_time:
+                    # Draw on a private copy so the published frame stays clean
+                    display_frame = display_frame.copy()
+                    # Add status message overlay to frame
+                    font = cv2.FONT_HERSHEY_SIMPLEX
+                    # Add a dark background behind the text for better visibility
+                    text_size = cv2.getTextSize(self.status_message, font, 1, 2)[0]
+                    cv2.rectangle(display_frame, (15, 15), (25 + text_size[0], 60), (0, 0, 0), -1)
+                    cv2.putText(display_frame, self.status_message, (20, 50), font, 1, (0, 255, 0), 2, cv2.LINE_AA)
+                
+                # Display the frame in a named window
+                cv2.imshow('Remote Screen', display_frame)
+                
+                # Update window dimensions for accurate scaling
+                window_rect = cv2.getWindowImageRect('Remote Screen')
+                if window_rect is not None and window_rect[2] > 0 and window_rect[3] > 0:
+                    self.window_width = window_rect[2]
+                    self.window_height = window_rect[3]
+                    
+                    # Update scaling factors
+                    self.scale_x = self.server_width / self.window_width
+                    self.scale_y = self.server_height / self.window_height
+                    
+                    # Rebuild the input transform only when the window actually moved or resized
+                    if tuple(window_rect) != self.input_geometry:
+                        self.set_input_geometry(*window_rect)
+                
+                # Check for key presses (this also paints the window)
+                key = cv2.waitKey(1) & 0xFF
+                
+                # The frames are on screen; let the server send more
+                self.acknowledge_frames(frames)
+                
+                # Handle keyboard mode toggle with Tab key (ASCII 9)
+                if key == 9:  # Tab key
+                    self.toggle_keyboard_mode()
+                elif self.keyboard_mode == "command":
+                    # In command mode, handle special keys
+                    if key == ord('q'):  # 'q' to quit
+                        self.show_status("Disconnecting...")
+                        logger.info("Received quit command, disconnecting")
+                        self.running = False
+                        break
+                    elif key == ord('c'):  # 'c' to toggle control
+                        self.control_enabled = not self.control_enabled
+                        status = "enabled" if self.control_enabled else "disabled"
+                        self.show_status(f"Control {status}")
+                        logger.info(f"Mouse and keyboard control {status}")
+                    elif key == ord('u'):  # 'u' to adjust mouse position DOWN
+                        self.ui_offset_y -= 5
+                        self.show_status(f"Y offset: {self.ui_offset_y}")
+                        logger.info(f"UI offset Y changed to {self.ui_offset_y}")
+                    elif key == ord('d'):  # 'd' to adjust mouse position UP
+                        self.ui_offset_y += 5
+                        self.show_status(f"Y offset: {self.ui_offset_y}")
+                        logger.info(f"UI offset Y changed to {self.ui_offset_y}")
+                
+            except ConnectionError as e:
+                logger.error(f"Screen sharing connection error: {e}")
+                break
+            except Exception as e:
+                logger.error(f"Screen sharing error: {e}")
+                traceback.print_exc()
+                continue
+    
+    def acknowledge_frames(self, frames):
+        """Tell the server every frame up to the last of a decoded batch has been displayed"""
+        # An empty batch is a timed-out wait
+        if not frames:
+            return
+        
+        # Acknowledgements are cumulative, so frames the mailbox skipped are covered too
+        header, _ = frames[-1]
+        self.send_screen_control({'type': 'ack', 'sequence': header.sequence})
+    
+    def receive_frames(self, receiver, mailbox):
+        """Receiver thread: read complete frames off the screen socket and post them to the decoder"""
+        try:
+            while self.running:
+                header, payload = receiver.read_frame()
+                self.input_latency.record_clock_sample(header.timestamp, time.time())
+                
+                # The payload view stays valid until the mailbox releases it, so it is posted without a copy
+                if mailbox.put(header, payload):
+                    logger.warning("Decoder fell behind, requesting a keyframe")
+                    self.send_screen_control({'type': 'keyframe'})
+        except Exception as e:
+            if self.running:
+                logger.error(f"Screen receive error: {e}")
+        finally:
+            mailbox.close()
+    
+    def composite_frame(self, header, payload):
+        """Apply a keyframe or a set of changed tiles to the persistent framebuffer"""
+        # Keep-alives carry no tiles; the framebuffer is still current
+        if header.flags & FLAG_KEEPALIVE:
+            return self.framebuffer
+        
+        keyframe = bool(header.flags & FLAG_KEYFRAME)
+        
+        # The decode reduction sets the framebuffer size, so it only changes on a keyframe
+        if keyframe:
+            self.decode_reduction = self.choose_decode_reduction(header.width, header.height)
+            self.reduction_keyframe_requested = False
+        elif (not self.reduction_keyframe_requested and
+                self.choose_decode_reduction(header.width, header.height) != self.decode_reduction):
+            # The display was resized enough to decode at another resolution
+            self.reduction_keyframe_requested = True
+            self.send_screen_control({'type': 'keyframe'})
+        
+        reduction = self.decode_reduction
+        
+        # (Re)allocate the framebuffer on keyframes or when the remote size changes
+        if (keyframe or self.framebuffer is None or
+                self.framebuffer_size != (header.width, header.height)):
+            if not keyframe:
+                logger.warning("Received delta tiles without a matching keyframe")
+            self.framebuffer = np.zeros(
+                (-(-header.height // reduction), -(-header.width // reduction), 3), dtype=np.uint8
+            )
+            self.framebuffer_size = (header.width, header.height)
+        
+        # Decode the tiles straight from the payload and paste them over the previous frame.
+        # Tile origins are multiples of the 16 px strip alignment, so they divide evenly.
+        codec = get_codec(header.codec)
+        
+        def decode_tile(tile):
+            x, y, w, h, encoded_tile = tile
+            return x // reduction, y // reduction, codec.timed_decode(encoded_tile, w, h, reduction)
+        
+        encoded_tiles = list(iter_tiles(payload, header.tile_count))
+        if len(encoded_tiles) > 1:
+            tiles = list(self.decode_pool.map(decode_tile, encoded_tiles))
+        else:
+            tiles = [decode_tile(tile) for tile in encoded_tiles]
+        composite_tiles(self.framebuffer, tiles)
+        
+        return self.framebuffer
+    
+    def choose_decode_reduction(self, frame_width, frame_height):
+        """
+        Pick the largest decode reduction that still leaves at least as many
+        pixels as the frame is displayed with
+        
+        Only the displayed image is scaled; mouse coordinates are mapped from
+        the display geometry to the server monitor size and are unaffected.
+        
+        Returns:
+            int: Reduction factor from DECODE_REDUCTIONS (1 = full resolution)
+        """
+        if not self.gui_window_info:
+            return 1
+        
+        display_width, display_height = self.gui_window_info[2:]
+        if self.viewport_size:
+            # The viewport is in device pixels, which exceeds the logical size on HiDPI screens
+            display_width = max(display_width, self.viewport_size[0])
+            display_height = max(display_height, self.viewport_size[1])
+        
+        if display_width <= 0 or display_height <= 0:
+            return 1
+        
+        for reduction in reversed(DECODE_REDUCTIONS):
+            if frame_width / reduction >= display_width and frame_height / reduction >= display_height:
+                return reduction
+        return 1
+    
     def toggle_keyboard_mode(self):
         """Toggle between typing and command mode"""
         if self.keyboard_mode == "typing":
@@ -330,7 +1094,8 @@ class RemoteControlClient:
         logger.info(f"Status message: {message}")
     
     def setup_mouse_control(self):
-        """Set up mouse and keyboard control"""
+        """Set up mouse and keyboard control, reconnecting with backoff after a drop"""
+        delay = RECONNECT_INITIAL_DELAY
         while self.running:
             try:
                 if not self.mouse_connected:
@@ -364,18 +1129,19 @@ class RemoteControlClient:
                     
                     logger.info("Mouse authentication successful")
                     self.mouse_connected = True
+                    delay = RECONNECT_INITIAL_DELAY
                     
                     # Start the input listeners
                     self.start_input_listeners()
                 
-                # Keep checking connection
-                time.sleep(1)
+                # Keep checking connection; a drop is noticed by send_input
+                time.sleep(RECONNECT_INITIAL_DELAY)
                 
             except Exception as e:
                 logger.error(f"Mouse control connection failed: {e}")
-                traceback.print_exc()
                 self.mouse_connected = False
-                time.sleep(2)  # Wait before trying to reconnect
+                time.sleep(delay)  # Wait before trying to reconnect
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
     
     def receive_json_response(self, socket):
         """Receive a JSON response with length prefix"""
@@ -436,16 +1202,87 @@ class RemoteControlClient:
             self.scale_x = self.server_width / width
             self.scale_y = self.server_height / height
             logger.debug(f"Updated GUI scaling factors: {self.scale_x}, {self.scale_y}")
+        
+        self.set_input_geometry(x, y, width, height)
+    
+    def set_viewport_size(self, width, height):
+        """
+        Declare the size the frames are displayed at
+        
+        The server fits its frames into this size before encoding, so a
+        windowed viewer does not pay for full-resolution frames.
+        
+        Args:
+            width (int): Width of the frame display in pixels
+            height (int): Height of the frame display in pixels
+        """
+        if width <= 0 or height <= 0 or (width, height) == self.viewport_size:
+            return
+        
+        self.viewport_size = (width, height)
+        if self.screen_connected:
+            self.send_viewport_size()
+    
+    def send_viewport_size(self):
+        """Send the declared viewport size to the screen server"""
+        width, height = self.viewport_size
+        logger.info(f"Declaring viewport size {width}x{height}")
+        self.send_screen_control({'type': 'viewport', 'width': width, 'height': height})
+    
+    def set_codec(self, codec_name):
+        """
+        Choose the codec the server encodes this viewer's frames with
+        
+        Args:
+            codec_name (str): Name of a registered codec (see frame_codecs.py)
+        
+        Returns:
+            bool: True if the codec is available
+        """
+        if codec_name not in get_codec_names():
+            logger.error(f"Unknown codec: {codec_name}")
+            return False
+        
+        if self.screen_connected and codec_name not in self.server_codecs:
+            logger.error(f"Server does not offer codec: {codec_name}")
+            return False
+        
+        self.codec_name = codec_name
+        logger.info(f"Requesting codec {codec_name}")
+        if self.screen_connected:
+            self.send_screen_control({'type': 'codec', 'name': codec_name})
+        return True
+    
+    def get_codec_stats(self):
+        """Get the decode cost of each codec as measured on this client"""
+        return {name: get_codec(name).get_stats() for name in get_codec_names()}
+    
+    def send_screen_control(self, message):
+        """Send a length-prefixed JSON control message on the screen socket"""
+        if not self.screen_connected:
+            return False
+        
+        if self.mux:
+            return self.mux.send_json(message)
+        
+        try:
+            message_bytes = json.dumps(message).encode('utf-8')
+            length = len(message_bytes).to_bytes(4, byteorder='big')
+            
+            with self.screen_send_lock:
+                self.screen_socket.sendall(length + message_bytes)
+            return True
+        except Exception as e:
+            logger.error(f"Error sending screen control message: {e}")
+            return False
     
     def start_input_listeners(self):
         """Start the mouse and keyboard listeners"""
         # Define event handlers
         def on_move(x, y):
             if self.control_enabled and self.mouse_connected:
-                # Apply scaling to convert client coordinates to server coordinates
-                scaled_x, scaled_y = self.scale_mouse_coordinates(x, y)
-                if scaled_x is not None and scaled_y is not None:
-                    self.send_command(f'move,{scaled_x},{scaled_y}')
+                # Only the newest position is kept; it is scaled and sent by the flush thread
+                self.input_sender.move(x, y)
         
         def on_click(x, y, button, pressed):
             if self.control_enabled and self.mouse_connected:
@@ -454,14 +1291,14 @@ class RemoteControlClient:
                     scaled_x, scaled_y = self.scale_mouse_coordinates(x, y)
                     if scaled_x is not None and scaled_y is not None:
                         if button == MouseButton.left:
-                            self.send_command(f'click,{scaled_x},{scaled_y}')
+                            self.input_sender.send_event(EVENT_CLICK, scaled_x, scaled_y, button=BUTTON_LEFT)
                         elif button == MouseButton.right:
-                            self.send_command(f'right_click,{scaled_x},{scaled_y}')
+                            self.input_sender.send_event(EVENT_CLICK, scaled_x, scaled_y, button=BUTTON_RIGHT)
             return self.running  # Continue if running
         
         def on_scroll(x, y, dx, dy):
             if self.control_enabled and self.mouse_connected:
-                self.send_command(f'scroll,{dx},{dy}')
+                self.input_sender.send_event(EVENT_SCROLL, int(dx), int(dy))
             return self.running  # Continue if running
         
         def on_press(key):
@@ -476,21 +1313,16 @@ class RemoteControlClient:
             
             if self.control_enabled and self.mouse_connected:
                 try:
-                    # Convert key to a consistent string representation
-                    if hasattr(key, 'char') and key.char is not None:
-                        key_str = f"char_{key.char}"
-                    else:
-                        key_str = f"key_{str(key)}"
+                    key_code = self.get_key_code(key)
+                    if key_code is None:
+                        return self.running
                     
                     # Thread-safe check and update of pressed keys
                     with self.keys_lock:
                         # Only send press event if this key is not already pressed
-                        if key_str not in self.pressed_keys:
-                            if hasattr(key, 'char') and key.char is not None:
-                                self.send_command(f'key_press,{key.char}')
-                            else:
-                                self.send_command(f'key_press,{key}')
-                            self.pressed_keys.add(key_str)
+                        if key_code not in self.pressed_keys:
+                            self.input_sender.send_event(EVENT_KEY_PRESS, key=key_code)
+                            self.pressed_keys.add(key_code)
                 except Exception as e:
                     logger.error(f"Error in key press handler: {e}")
             return self.running  # Continue if running
@@ -507,23 +1339,17 @@ class RemoteControlClient:
             
             if self.control_enabled and self.mouse_connected:
                 try:
-                    # Convert key to the same string representation used in on_press
-                    if hasattr(key, 'char') and key.char is not None:
-                        key_str = f"char_{key.char}"
-                    else:
-                        key_str = f"key_{str(key)}"
+                    key_code = self.get_key_code(key)
+                    if key_code is None:
+                        return self.running
                     
-                    # Send the release command
-                    if hasattr(key, 'char') and key.char is not None:
-                        self.send_command(f'key_release,{key.char}')
-                    else:
-                        self.send_command(f'key_release,{key}')
+                    # Send the release event
+                    self.input_sender.send_event(EVENT_KEY_RELEASE, key=key_code)
                     
                     # Thread-safe update of pressed keys
                     with self.keys_lock:
                         # Remove from pressed keys set
-                        if key_str in self.pressed_keys:
-                            self.pressed_keys.remove(key_str)
+                        self.pressed_keys.discard(key_code)
                 except Exception as e:
                     logger.error(f"Error in key release handler: {e}")
             return self.running  # Continue if running
@@ -535,6 +1361,15 @@ class RemoteControlClient:
         if self.keyboard_listener:
             self.keyboard_listener.stop()
         
+        if self.input_sender:
+            self.input_sender.stop()
+        
+        # Event IDs start over with each input connection
+        self.input_latency.reset()
+        self.input_sender = InputSender(
+            self.send_input, self.scale_mouse_coordinates, self.mouse_move_rate, self.input_latency
+        )
+        
         # Start listeners in non-blocking mode
         self.mouse_listener = MouseListener(
             on_move=on_move,
@@ -549,176 +1384,125 @@ class RemoteControlClient:
         )
         self.keyboard_listener.start()
     
+    def set_input_geometry(self, x, y, width, height):
+        """Set the screen rect the remote frame is displayed in and rebuild the input transform"""
+        self.input_geometry = (x, y, width, height)
+        self.update_input_transform()
+    
+    def update_input_transform(self):
+        """
+        Precompute the mapping from client screen to server coordinates
+        
+        Called whenever the display geometry or the server monitor size
+        changes. The remote image is fitted into the display rect keeping its
+        aspect ratio, so the letterbox or pillarbox bars are worked out here
+        once instead of on every mouse event.
+        """
+        geometry = self.input_geometry
+        if geometry is None or self.server_width <= 0 or self.server_height <= 0:
+            self.input_transform = None
+            return
+        
+        x, y, width, height = geometry
+        if width <= 0 or height <= 0:
+            self.input_transform = None
+            return
+        
+        server_aspect = self.server_width / self.server_height
+        if server_aspect > width / height:
+            # Display is taller relative to width: bars above and below
+            image_width = width
+            image_height = width / server_aspect
+        else:
+            # Display is wider relative to height: bars left and right
+            image_width = height * server_aspect
+            image_height = height
+        
+        left = x + (width - image_width) / 2
+        top = y + (height - image_height) / 2
+        
+        # Replaced in one assignment, so the listener threads never see a half-updated transform
+        self.input_transform = (
+            left, top, left + image_width, top + image_height,
+            self.server_width / image_width, self.server_height / image_height,
+            self.server_width - 1, self.server_height - 1
+        )
+        logger.debug(f"Input transform updated: {self.input_transform}")
+    
     def scale_mouse_coordinates(self, x, y):
         """
         Scale mouse coordinates from client space to server space
-        and check if mouse is within the remote screen window
+        and check if mouse is within the remote screen image
+        
+        Uses the transform cached by update_input_transform(), so this is a
+        bounds check and a couple of multiply-adds; it runs on the input
+        listener threads and must never block.
+        
+        Returns:
+            tuple: (server x, server y), or (None, None) outside the remote image
         """
-        try:
-            # For GUI mode, use the frame dimensions directly instead of OpenCV window
-            if self.frame_callback and self.gui_window_info:
-                # Get frame display dimensions from the GUI
-                frame_x, frame_y, frame_width, frame_height = self.gui_window_info
-                
-                # Check if coordinates are within frame area
-                if (frame_x <= x < frame_x + frame_width and
-                    frame_y <= y < frame_y + frame_height):
-                    
-                    # Convert to relative frame coordinates
-                    rel_x = x - frame_x
-                    rel_y = y - frame_y
-                    
-                    # Apply scaling to match server resolution
-                    # Make sure we're not dividing by zero
-                    if frame_width > 0 and frame_height > 0:
-                        # Calculate scaling based on aspect ratio preservation
-                        server_aspect = self.server_width / self.server_height
-                        frame_aspect = frame_width / frame_height
-                        
-                        if server_aspect > frame_aspect:
-                            # Frame is taller relative to width
-                            scale_factor = self.server_width / frame_width
-                            # Adjust Y to account for letterboxing
-                            effective_height = self.server_width / server_aspect
-                            y_offset = (frame_height - (frame_width / server_aspect)) / 2
-                            
-                            # If the click is in the letterbox area, ignore it
-                            if rel_y < y_offset or rel_y > frame_height - y_offset:
-                                return None, None
-                                
-                            # Adjust Y coordinate
-                            rel_y = rel_y - y_offset
-                            
-                            server_x = int(rel_x * (self.server_width / frame_width))
-                            server_y = int(rel_y * (self.server_height / (frame_height - 2 * y_offset)))
-                        else:
-                            # Frame is wider relative to height
-                            scale_factor = self.server_height / frame_height
-                            # Adjust X to account for pillarboxing
-                            effective_width = self.server_height * frame_aspect
-                            x_offset = (frame_width - (frame_height * server_aspect)) / 2
-                            
-                            # If the click is in the pillarbox area, ignore it
-                            if rel_x < x_offset or rel_x > frame_width - x_offset:
-                                return None, None
-                                
-                            # Adjust X coordinate
-                            rel_x = rel_x - x_offset
-                            
-                            server_x = int(rel_x * (self.server_width / (frame_width - 2 * x_offset)))
-                            server_y = int(rel_y * (self.server_height / frame_height))
-                        
-                        # Apply UI offset to Y coordinate
-                        server_y += self.ui_offset_y
-                        
-                        # Ensure the coordinates stay within server screen bounds
-                        server_x = max(0, min(server_x, self.server_width - 1))
-                        server_y = max(0, min(server_y, self.server_height - 1))
-                        
-                        # Log coordinates for debugging only at debug level
-                        logger.debug(f"GUI mode: Mouse at {x},{y} -> server {server_x},{server_y}")
-                        
-                        return server_x, server_y
-            
-                return None, None
-                
-            # For OpenCV window mode
-            window_rect = cv2.getWindowImageRect('Remote Screen')
-            if window_rect is None:
-                return None, None
-                
-            window_x, window_y, window_width, window_height = window_rect
-            
-            # Check if coordinates are within window
-            if (window_x <= x < window_x + window_width and
-                window_y <= y < window_y + window_height):
-                
-                # Convert to relative window coordinates
-                rel_x = x - window_x
-                rel_y = y - window_y
-                
-                # Calculate how much of the window is actually displaying the image
-                # (accounting for letterboxing/pillarboxing)
-                server_aspect = self.server_width / self.server_height
-                window_aspect = window_width / window_height
-                
-                if server_aspect > window_aspect:
-                    # Window is taller relative to width (letterboxing)
-                    effective_height = window_width / server_aspect
-                    vertical_padding = (window_height - effective_height) / 2
-                    
-                    # Check if click is in the letterbox area
-                    if rel_y < vertical_padding or rel_y > (window_height - vertical_padding):
-                        return None, None
-                    
-                    # Adjust y coordinate to account for letterboxing
-                    rel_y = rel_y - vertical_padding
-                    
-                    # Scale coordinates
-                    server_x = int(rel_x * (self.server_width / window_width))
-                    server_y = int(rel_y * (self.server_height / effective_height)) + self.ui_offset_y
-                else:
-                    # Window is wider relative to height (pillarboxing)
-                    effective_width = window_height * server_aspect
-                    horizontal_padding = (window_width - effective_width) / 2
-                    
-                    # Check if click is in the pillarbox area
-                    if rel_x < horizontal_padding or rel_x > (window_width - horizontal_padding):
-                        return None, None
-                    
-                    # Adjust x coordinate to account for pillarboxing
-                    rel_x = rel_x - horizontal_padding
-                    
-                    # Scale coordinates
-                    server_x = int(rel_x * (self.server_width / effective_width))
-                    server_y = int(rel_y * (self.server_height / window_height)) + self.ui_offset_y
-                
-                # Ensure the coordinates stay within server screen bounds
-                server_x = max(0, min(server_x, self.server_width - 1))
-                server_y = max(0, min(server_y, self.server_height - 1))
-                
-                # Log coordinates for debugging
-                logger.debug(f"OpenCV mode: Mouse at {x},{y} -> server {server_x},{server_y}")
-                
-                return server_x, server_y
-            
+        transform = self.input_transform
+        if transform is None:
             return None, None
-        except Exception as e:
-            logger.error(f"Error scaling mouse coordinates: {e}")
-            traceback.print_exc()
+        
+        left, top, right, bottom, scale_x, scale_y, max_x, max_y = transform
+        if not (left <= x < right and top <= y < bottom):
             return None, None
+        
+        server_x = min(int((x - left) * scale_x), max_x)
+        server_y = max(0, min(int((y - top) * scale_y) + self.ui_offset_y, max_y))
+        return server_x, server_y
     
-    def send_command(self, command):
-        """Send a command to the server with a length prefix"""
-        if self.mouse_socket and self.mouse_connected:
+    def get_key_code(self, key):
+        """Get the wire key code for a pynput key, or None if it cannot be sent"""
+        char = getattr(key, 'char', None)
+        if char is not None and len(char) == 1:
+            return ord(char)
+        
+        key_code = self.key_codes.get(key)
+        if key_code is not None:
+            return key_code
+        
+        # Keys without a character or a name are sent by virtual-key code
+        vk = getattr(key, 'vk', None)
+        if vk is not None:
+            return VK_KEY_BASE + vk
+        return None
+    
+    def send_input(self, data):
+        """Send encoded input events to the server"""
+        if self.mux and self.mouse_connected:
+            # Queued ahead of any screen or control data still waiting to go out
+            self.mux.send(CHANNEL_INPUT, data)
+        elif self.mouse_socket and self.mouse_connected:
             try:
-                # Encode the command string to bytes
-                command_bytes = command.encode('utf-8')
-                
-                # Create the 4-byte length prefix
-                length = len(command_bytes).to_bytes(4, byteorder='big')
-                
-                # Combine length prefix and command data
-                complete_message = length + command_bytes
-                
-                # Use sendall to ensure the entire message is sent
-                self.mouse_socket.sendall(complete_message)
+                self.mouse_socket.sendall(data)
                 
             except (ConnectionResetError, BrokenPipeError) as e:
                 logger.error(f"Lost connection to server: {e}")
                 self.mouse_connected = False
             except Exception as e:
-                logger.error(f"Error sending command: {e}")
+                logger.error(f"Error sending input event: {e}")
                 traceback.print_exc()
                 self.mouse_connected = False
     
+    def get_input_latency_stats(self):
+        """Get input-to-inject and input-to-photon latency histograms"""
+        return self.input_latency.get_stats()
+    
     def get_latest_frame(self):
-        """Get the latest received frame"""
-        return self.latest_frame
+        """Get the latest decoded frame (treat it as read-only)"""
+        with self.frame_lock:
+            return self.latest_frame
+    
+    def get_latest_frame_with_sequence(self):
+        """Get (sequence number, frame) for the latest decoded frame (treat it as read-only)"""
+        with self.frame_lock:
+            return self.frame_count, self.latest_frame
     
     def is_connected(self):
         """Check if the client is connected to the server"""
-        return self.screen_socket is not None and self.mouse_connected
+        return (self.screen_socket is not None or self.mux is not None) and self.mouse_connected
     
     def toggle_control(self):
         """Toggle mouse and keyboard control"""
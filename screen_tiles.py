@@ -0,0 +1,172 @@
+import threading
+import zlib
+import numpy as np
+
+# Default edge length of a delta tile in pixels (a multiple of the 16x16 JPEG MCU)
+TILE_SIZE = 64
+
+# Above this fraction of changed tiles a single full frame is cheaper to encode
+KEYFRAME_THRESHOLD = 0.5
+
+# Strip heights are kept to a multiple of the JPEG MCU height so strip seams match block edges
+STRIP_ALIGN = 16
+
+
+class ChangeDetector:
+    """
+    Cheap check for whether the screen changed, run before any conversion or encoding
+
+    Each call hashes every row_stride-th row of the raw capture. The sampled
+    rows rotate between calls, so a change confined to rows skipped by one
+    call is still seen within row_stride captures. Once a change is seen,
+    every phase's digest is refreshed, so the change is reported only once.
+    """
+
+    def __init__(self, row_stride=4):
+        self.row_stride = row_stride
+        self.phase = 0
+        self.digests = [None] * row_stride
+
+        # Reused per-phase buffers for the sampled rows
+        self.samples = {}
+
+    def reset(self):
+        """Forget the stored digests so the next capture counts as changed"""
+        self.digests = [None] * self.row_stride
+
+    def has_changed(self, frame):
+        """
+        Check a raw capture against the previous captures
+
+        Args:
+            frame (np.ndarray): Raw capture (H x W x C)
+
+        Returns:
+            bool: True if the sampled rows differ from the last time they were sampled
+        """
+        phase = self.phase
+        self.phase = (phase + 1) % self.row_stride
+
+        digest = self._digest(frame, phase)
+        if digest == self.digests[phase]:
+            return False
+
+        # The other phases still hold digests from before the change; without
+        # refreshing them each would report the same change again
+        for other in range(self.row_stride):
+            self.digests[other] = digest if other == phase else self._digest(frame, other)
+        return True
+
+    def _digest(self, frame, phase):
+        """Hash one phase's sampled rows"""
+        # Gather the sampled rows into a reused contiguous buffer for hashing
+        rows = frame[phase::self.row_stride]
+        sample = self.samples.get(phase)
+        if sample is None or sample.shape != rows.shape:
+            sample = self.samples[phase] = np.empty_like(rows)
+        np.copyto(sample, rows)
+        return zlib.crc32(sample)
+
+
+def find_changed_tiles(frame, previous, tile_size=TILE_SIZE, mask=None):
+    """
+    Find the tiles that differ between two frames of the same shape
+
+    Args:
+        frame (np.ndarray): Current frame (H x W x C)
+        previous (np.ndarray): Previous frame (H x W x C)
+        tile_size (int): Edge length of a tile in pixels
+        mask (np.ndarray): Optional reusable bool buffer of the frame's shape
+
+    Returns:
+        tuple: (list of (x, y, width, height) rects, fraction of tiles changed)
+    """
+    height, width = frame.shape[:2]
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+
+    # Per-byte change mask with the channels folded into the row (np.any over a
+    # 3-wide axis is several times slower than reducing the flat row directly)
+    changed = np.not_equal(frame, previous, out=mask).reshape(height, width * channels)
+
+    # Reduce the mask to one flag per tile; reduceat handles the uneven last row/column
+    row_starts = np.arange(0, height, tile_size)
+    col_starts = np.arange(0, width, tile_size) * channels
+    tile_mask = np.logical_or.reduceat(changed, row_starts, axis=0)
+    tile_mask = np.logical_or.reduceat(tile_mask, col_starts, axis=1)
+
+    rows, cols = np.nonzero(tile_mask)
+    rects = []
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        x = col * tile_size
+        y = row * tile_size
+        rects.append((x, y, min(tile_size, width - x), min(tile_size, height - y)))
+
+    return rects, len(rects) / tile_mask.size
+
+
+class FrameBufferPool:
+    """
+    Recycles preallocated frame buffers between the capture and encode stages
+
+    A buffer is owned by one stage at a time: the capture stage acquires it,
+    and whichever stage drops or replaces the frame releases it again.
+    """
+
+    def __init__(self, max_buffers=4):
+        self.max_buffers = max_buffers
+        self.shape = None
+        self.free = []
+        self.lock = threading.Lock()
+
+    def acquire(self, shape):
+        """Get a uint8 buffer of the given shape, allocating only when none is free"""
+        with self.lock:
+            if shape != self.shape:
+                # The capture size changed; buffers of the old size are useless
+                self.shape = shape
+                self.free = []
+            elif self.free:
+                return self.free.pop()
+
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buffer):
+        """Return a buffer to the pool once no stage references it"""
+        with self.lock:
+            if buffer.shape == self.shape and len(self.free) < self.max_buffers:
+                self.free.append(buffer)
+
+
+def split_strips(width, height, count, align=STRIP_ALIGN):
+    """
+    Split a full frame into horizontal strips that can be encoded independently
+
+    Args:
+        width (int): Frame width
+        height (int): Frame height
+        count (int): Desired number of strips
+        align (int): Strip heights are rounded up to a multiple of this
+
+    Returns:
+        list: List of (x, y, width, height) rects covering the frame
+    """
+    strip_height = -(-height // max(count, 1))
+    strip_height = -(-strip_height // align) * align
+
+    return [
+        (0, y, width, min(strip_height, height - y))
+        for y in range(0, height, strip_height)
+    ]
+
+
+def composite_tiles(framebuffer, tiles):
+    """
+    Paste decoded tiles into a framebuffer in place
+
+    Args:
+        framebuffer (np.ndarray): Destination frame (H x W x 3)
+        tiles (list): List of (x, y, decoded tile image)
+    """
+    for x, y, tile in tiles:
+        tile_height, tile_width = tile.shape[:2]
+        framebuffer[y:y + tile_height, x:x + tile_width] = tile
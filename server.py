@@ -2,19 +2,33 @@ import cv2
 import numpy as np
 import socket
 import pickle
-import struct
 import mss
 from pynput.mouse import Controller as MouseController, Button as MouseButton
-from pynput.keyboard import Controller as KeyboardController, Key
+from pynput.keyboard import Controller as KeyboardController, Key, KeyCode
 import threading
+import queue
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import time
-import select
 import traceback
 import json
 import hashlib
+import secrets
 import os
 import logging
 from datetime import datetime, timedelta
+from screen_tiles import (
+    TILE_SIZE, KEYFRAME_THRESHOLD, ChangeDetector, FrameBufferPool, find_changed_tiles, split_strips
+)
+from protocol import PROTOCOL_VERSION, FLAG_KEYFRAME, FLAG_KEEPALIVE, pack_frame
+from frame_codecs import DEFAULT_CODEC, CODECS_BY_NAME, get_codec, get_codec_names
+from rate_control import AdaptiveQualityController
+from input_protocol import (
+    INPUT_EVENT, INPUT_BATCH, MAX_INPUT_BATCH, EVENT_MOVE, EVENT_CLICK, EVENT_SCROLL, EVENT_KEY_PRESS, EVENT_KEY_RELEASE,
+    BUTTON_LEFT, BUTTON_RIGHT, SPECIAL_KEY_BASE, VK_KEY_BASE, build_key_table
+)
+from mux import MuxConnection, CHANNEL_CONTROL, CHANNEL_INPUT, CHANNEL_SCREEN
 
 # Custom JSON encoder to handle datetime objects
 class DateTimeEncoder(json.JSONEncoder):
@@ -34,6 +48,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger("RemoteServer")
 
+# Per-viewer send buffer: the sender stops writing frames once more than the
+# high-water mark is buffered and resumes below the low-water mark. This
+# bounds how stale the frames a congested viewer receives can get.
+VIEWER_HIGH_WATER = 256 * 1024
+VIEWER_LOW_WATER = 64 * 1024
+
+# Seconds after a viewer disconnects during which it can resume its session with a ticket
+RESUME_TICKET_LIFETIME = 30
+
+# TCP keepalive on client connections, so a peer that vanished without closing
+# (e.g. after a Wi-Fi roam) is noticed after about IDLE + INTERVAL * COUNT seconds
+TCP_KEEPALIVE_IDLE = 5
+TCP_KEEPALIVE_INTERVAL = 2
+TCP_KEEPALIVE_COUNT = 3
+
 class PickleUserDatabase:
     """Simple user database using pickle for storage"""
     
@@ -257,21 +286,270 @@ class PickleUserDatabase:
         return username in self.users
 
 
+class ScreenViewer:
+    """
+    A connected screen sharing client with its own send queue and drop policy
+    
+    The encode thread queues frames; the viewer's sender runs as a coroutine
+    on the server's event loop and is woken through the loop. Frames are
+    written without waiting for them to reach the network, up to
+    VIEWER_HIGH_WATER bytes in flight; past that the sender stalls and
+    frames queued meanwhile are dropped in favour of the next keyframe.
+    
+    Viewers that acknowledge frames are also flow controlled by a window:
+    at most frame_window frames are sent without an acknowledgement.
+    """
+    
+    def __init__(self, loop, writer, addr, username, token, frame_window=2, queue_size=2):
+        self.loop = loop
+        self.writer = writer
+        self.addr = addr
+        self.username = username
+        self.token = token
+        
+        # (encoded frame, sequence number) pairs waiting to be sent to this viewer
+        self.send_queue = queue.Queue(maxsize=queue_size)
+        
+        # Set on the event loop whenever a frame is queued or the viewer is deactivated
+        self.frame_ready = asyncio.Event()
+        
+        # Cleared when the viewer disconnects
+        self.active = threading.Event()
+        self.active.set()
+        
+        # Deltas are useless without their keyframe, so a new or lagging viewer waits for one
+        self.needs_keyframe = True
+        
+        # Frame display size declared by the viewer (None = full resolution)
+        self.viewport_size = None
+        
+        # Codec negotiated with the viewer
+        self.codec = get_codec(DEFAULT_CODEC)
+        
+        # (sequence number, send time) of frames sent but not yet acknowledged, and the last
+        # acknowledged sequence number; a viewer that never acknowledges (acked_sequence None) has no window
+        self.frame_window = frame_window
+        self.unacked = deque()
+        self.acked_sequence = None
+        
+        # Single-use ticket for resuming this session after a dropped connection
+        self.resume_ticket = None
+        
+        # Statistics
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.dropped_frames = 0
+        self.replaced_frames = 0
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.stall_start = None  # Set while the sender is stalled
+        self.window_skips = 0
+    
+    def frames_in_flight(self):
+        """Get the number of frames queued or sent but not yet acknowledged"""
+        return len(self.unacked) + self.send_queue.qsize()
+    
+    def window_open(self, pending=0):
+        """Check whether the viewer can take another frame, with `pending` more already on their way"""
+        return self.acked_sequence is None or self.frames_in_flight() + pending < self.frame_window
+    
+    def acknowledge(self, sequence=None):
+        """
+        Record that the viewer has displayed every frame up to `sequence` (default: all sent)
+        
+        Returns:
+            float: Seconds from sending the acknowledged frame to its acknowledgement
+                arriving, or None if it was not among the unacknowledged frames
+        """
+        if sequence is None:
+            self.unacked.clear()
+            return None
+        
+        self.acked_sequence = sequence & 0xFFFFFFFF
+        round_trip = None
+        while self.unacked and self.unacked[0][0] <= self.acked_sequence:
+            acked, send_time = self.unacked.popleft()
+            if acked == self.acked_sequence:
+                round_trip = time.time() - send_time
+        return round_trip
+    
+    def enqueue(self, data, keyframe, sequence, keepalive=False):
+        """
+        Queue a shared encoded frame for this viewer
+        
+        When the queue is full the viewer has fallen behind: its backlog is
+        discarded and it skips frames until the next keyframe, which the
+        encoder produces as soon as it sees needs_keyframe. A keyframe
+        arriving at a full queue replaces the backlog straight away. A viewer
+        whose window is full skips the frame the same way.
+        """
+        if not self.window_open():
+            self.window_skips += 1
+            # A skipped keep-alive changes nothing, a skipped frame breaks the delta chain
+            if not keepalive:
+                self.dropped_frames += 1
+                self.needs_keyframe = True
+            return
+        
+        if self.needs_keyframe and not keyframe:
+            self.dropped_frames += 1
+            return
+        
+        try:
+            self.send_queue.put_nowait((data, sequence))
+            self.needs_keyframe = False
+            self.notify()
+        except queue.Full:
+            while True:
+                try:
+                    self.send_queue.get_nowait()
+                    self.dropped_frames += 1
+                except queue.Empty:
+                    break
+            
+            # Only the encoder thread puts frames, so the emptied queue has room
+            if keyframe:
+                self.send_queue.put_nowait((data, sequence))
+                self.needs_keyframe = False
+                self.replaced_frames += 1
+                self.notify()
+            else:
+                self.dropped_frames += 1
+                self.needs_keyframe = True
+    
+    def get_stats(self):
+        """Get this viewer's streaming statistics"""
+        return {
+            'username': self.username,
+            'address': self.addr[0],
+            'frames_sent': self.frames_sent,
+            'bytes_sent': self.bytes_sent,
+            'bytes_in_flight': self.bytes_in_flight(),
+            'dropped_frames': self.dropped_frames,
+            'replaced_frames': self.replaced_frames,
+            'stalls': self.stalls,
+            'stall_time': self.stall_time + (time.time() - self.stall_start if self.stall_start else 0.0),
+            'frames_in_flight': self.frames_in_flight(),
+            'window_skips': self.window_skips,
+            'viewport': self.viewport_size,
+            'codec': self.codec.name
+        }
+    
+    def notify(self):
+        """Wake the viewer's sender (callable from any thread)"""
+        try:
+            self.loop.call_soon_threadsafe(self.frame_ready.set)
+        except RuntimeError:
+            # The event loop has already shut down
+            pass
+    
+    def deactivate(self):
+        """Mark the viewer disconnected and wake its sender (callable from any thread)"""
+        self.active.clear()
+        self.notify()
+    
+    async def next_frame(self):
+        """Wait for the next queued (frame, sequence) pair, or None once the viewer is deactivated"""
+        while self.active.is_set():
+            # Clear before looking, so a frame queued after the check still wakes us
+            self.frame_ready.clear()
+            try:
+                return self.send_queue.get_nowait()
+            except queue.Empty:
+                await self.frame_ready.wait()
+        return None
+    
+    def bytes_in_flight(self):
+        """Get the number of bytes written to the viewer but not yet handed to the network"""
+        return self.writer.transport.get_write_buffer_size()
+    
+    async def wait_writable(self):
+        """Wait while the send buffer is above the high-water mark"""
+        # The transport's flow control (see handle_screen_client) pauses at
+        # VIEWER_HIGH_WATER and resumes at VIEWER_LOW_WATER
+        await self.writer.drain()
+    
+    def send_frame(self, data):
+        """Write one encoded frame to the viewer without waiting for it to be sent"""
+        # Frames are self-delimiting (see protocol.py), so send them as-is
+        self.writer.write(data)
+    
+    def close(self):
+        """Close the viewer's connection (on the event loop)"""
+        self.deactivate()
+        self.writer.close()
+
+
+class MuxScreenViewer(ScreenViewer):
+    """A screen viewer on a multiplexed connection (see mux.py)"""
+    
+    def __init__(self, loop, connection, addr, username, token, frame_window=2):
+        super().__init__(loop, None, addr, username, token, frame_window)
+        self.connection = connection
+        
+        # Screen bytes queued on the connection but not yet written; maintained on the event loop
+        self.queued_bytes = 0
+        self.writable = asyncio.Event()
+        self.writable.set()
+    
+    def bytes_in_flight(self):
+        """Get the number of screen bytes queued on the connection but not yet written"""
+        return self.queued_bytes
+    
+    async def wait_writable(self):
+        """Wait while the queued screen data is above the high-water mark"""
+        if self.queued_bytes > VIEWER_HIGH_WATER:
+            self.writable.clear()
+            await self.writable.wait()
+    
+    def frame_written(self, size):
+        """Account for a frame the connection has written (on the event loop)"""
+        self.queued_bytes -= size
+        if self.queued_bytes <= VIEWER_LOW_WATER:
+            self.writable.set()
+    
+    def send_frame(self, data):
+        """Queue one encoded frame on the screen channel"""
+        size = len(data)
+        
+        def on_sent():
+            try:
+                self.loop.call_soon_threadsafe(self.frame_written, size)
+            except RuntimeError:
+                # The event loop has already shut down
+                pass
+        
+        # Input and control messages overtake the frame chunk by chunk
+        if not self.connection.send(CHANNEL_SCREEN, data, on_sent=on_sent):
+            raise ConnectionError("Multiplexed connection closed")
+        self.queued_bytes += size
+    
+    def close(self):
+        """Close the viewer's connection"""
+        self.deactivate()
+        self.connection.close()
+
+
 class RemoteControlServer:
     """
     Remote control server with pickle-based authentication
     """
     
-    def __init__(self, host='0.0.0.0', screen_port=5000, mouse_port=5001, auth_port=5002, db_file="users.pickle"):
+    def __init__(self, host='0.0.0.0', screen_port=5000, mouse_port=5001, auth_port=5002, db_file="users.pickle",
+                 target_bitrate=10_000_000, target_latency=0.1, mux_port=5003, frame_window=2):
         # Initialize controllers
         self.mouse = MouseController()
         self.keyboard = KeyboardController()
         
+        # Input events carry numeric codes; resolve them with prebuilt tables
+        self.key_table = build_key_table(Key)
+        self.mouse_buttons = {BUTTON_LEFT: MouseButton.left, BUTTON_RIGHT: MouseButton.right}
+        
         # Initialize screen sharing socket
         self.socket_screen = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket_screen.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket_screen.bind((host, screen_port))
-        self.socket_screen.listen(1)
+        self.socket_screen.listen(5)
         
         # Initialize mouse control socket
         self.socket_mouse = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -285,19 +563,101 @@ class RemoteControlServer:
         self.socket_auth.bind((host, auth_port))
         self.socket_auth.listen(5)
         
+        # Initialize multiplexed socket (auth, screen and input on one connection)
+        self.socket_mux = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket_mux.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket_mux.bind((host, mux_port))
+        self.socket_mux.listen(5)
+        
         # Initialize screen capture
         self.sct = mss.mss()
         self.monitor = self.sct.monitors[2]  # Get primary monitor (usually index 1)
         
+        # Previous frame for tile-based delta encoding (None forces a keyframe)
+        self.previous_frame = None
+        self.tile_size = TILE_SIZE
+        self.frame_sequence = 0
+        
+        # Capture pacing and pipeline statistics
+        self.frame_interval = 0.03  # Fastest interval between captures (~30 FPS)
+        self.dropped_frames = 0
+        
+        # Static screen detection: unchanged captures skip conversion and encoding,
+        # and viewers get a tiny keep-alive frame instead
+        self.change_detector = ChangeDetector()
+        self.keepalive_interval = 1.0  # Seconds between keep-alives on a static screen
+        self.static_frames = 0
+        
+        # Capture -> encode holds only the newest raw frame
+        self.raw_frames = queue.Queue(maxsize=1)
+        
+        # Frame flow control: viewers acknowledge the frames they have displayed,
+        # and capture pauses while no viewer has room in its window of
+        # unacknowledged frames. Frames captured but not yet handed to the
+        # viewers count against every window.
+        self.frame_window = frame_window
+        self.frames_in_pipeline = 0
+        self.pipeline_lock = threading.Lock()
+        self.ack_received = threading.Event()
+        self.window_waits = 0
+        
+        # Preallocated buffers so steady-state capture does not churn the allocator:
+        # pooled BGR frames (owned by one stage at a time), a scaled BGRA scratch
+        # buffer for the capture stage and a change mask for the encode stage
+        self.frame_pool = FrameBufferPool()
+        self.scaled_capture = None
+        self.change_mask = None
+        
+        # OpenCV releases the GIL while encoding, so strips and tiles are encoded on a pool
+        self.encode_workers = os.cpu_count() or 1
+        self.encode_pool = ThreadPoolExecutor(max_workers=self.encode_workers)
+        
+        # Password hashing (PBKDF2) and user database writes run here, off the event loop
+        self.auth_pool = ThreadPoolExecutor(max_workers=4)
+        
+        # Connection log entries are written by one background thread, in order,
+        # so a slow disk never stalls the event loop
+        self.log_pool = ThreadPoolExecutor(max_workers=1)
+        
+        # Event loop serving every connection (see serve); set while it runs
+        self.loop = None
+        self.stop_event = None
+        
+        # Connected screen viewers, all fed by the one capture/encode pipeline
+        self.viewers = []
+        self.viewers_lock = threading.Lock()
+        self.viewers_present = threading.Event()
+        
+        # Adapts quality, scale and frame rate to the target bitrate/latency
+        self.rate_controller = AdaptiveQualityController(
+            target_bitrate=target_bitrate,
+            target_latency=target_latency,
+            min_frame_interval=self.frame_interval
+        )
+        
         # Client connections
-        self.screen_client = None
         self.mouse_client = None
         
+        # Input batches waiting for the injection worker, as (events, receive time);
+        # OS input injection can be slow, so it never runs on the socket thread
+        self.input_queue = queue.Queue()
+        self.input_stats_lock = threading.Lock()
+        self.input_events = 0
+        self.input_queue_delay_total = 0.0
+        self.input_queue_delay_max = 0.0
+        
+        # (event ID, injection time) of the last injected input event; sampled at
+        # capture time and echoed in the frame header for latency measurement
+        self.last_input = (0, 0.0)
+        
         # Authenticated sessions
-        self.screen_token = None
         self.mouse_token = None
         
-        # Flags to control serverniggeer 
+        # Resume tickets issued to screen viewers (see issue_resume_ticket)
+        self.resume_tickets = {}
+        self.resume_lock = threading.Lock()
+        
+        # Flags to control server
         self.running = True
         
         # User database
@@ -310,102 +670,153 @@ class RemoteControlServer:
         logger.info(f"Screen sharing server listening on {host}:{screen_port}")
         logger.info(f"Mouse control server listening on {host}:{mouse_port}")
         logger.info(f"Authentication server listening on {host}:{auth_port}")
+        logger.info(f"Multiplexed server listening on {host}:{mux_port}")
         logger.info(f"Using monitor with resolution: {self.monitor['width']}x{self.monitor['height']}")
     
     def start(self):
         """Start all server components"""
-        # Start the authentication server thread
-        auth_thread = threading.Thread(target=self.handle_authentication)
-        auth_thread.daemon = True
-        auth_thread.start()
+        # Start the input injection worker
+        input_thread = threading.Thread(target=self.input_worker)
+        input_thread.daemon = True
+        input_thread.start()
         
-        # Start the mouse control thread
-        mouse_thread = threading.Thread(target=self.handle_mouse_control)
-        mouse_thread.daemon = True
-        mouse_thread.start()
+        # Start the shared capture and encode stages
+        capture_thread = threading.Thread(target=self.capture_loop)
+        capture_thread.daemon = True
+        capture_thread.start()
         
-        # Handle screen sharing in the main thread
-        self.handle_screen_sharing()
-    
-    def handle_authentication(self):
-        """Handle authentication requests"""
-        while self.running:
-            try:
-                # Wait for connections with timeout
-                readable, _, _ = select.select([self.socket_auth], [], [], 1)
-                
-                if readable:
-                    client_socket, addr = self.socket_auth.accept()
-                    logger.info(f"Auth client connected from {addr}")
-                    
-                    # Handle this client in a separate thread
-                    client_thread = threading.Thread(
-                        target=self.handle_auth_client,
-                        args=(client_socket, addr)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-            except Exception as e:
-                logger.error(f"Authentication server error: {e}")
-                traceback.print_exc()
-                time.sleep(1)
+        encode_thread = threading.Thread(target=self.encode_loop)
+        encode_thread.daemon = True
+        encode_thread.start()
+        
+        # Serve every connection from the event loop in the main thread
+        asyncio.run(self.serve())
     
-    def handle_auth_client(self, client_socket, addr):
-        """Handle a single authentication client"""
+    async def serve(self):
+        """
+        Serve all services from one asyncio event loop until stop() is called
+        
+        Every connection is a task on this loop rather than a thread, and
+        accepts are event driven instead of polled. Capture and encode keep
+        their dedicated pipeline threads; password hashing and database
+        writes run on the auth pool.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        
+        # One input controller at a time, in connection order
+        self.mouse_lock = asyncio.Lock()
+        
+        # Running multiplexed sessions, and the other connections' handler tasks and writers
+        self.mux_tasks = set()
+        self.client_tasks = set()
+        self.client_writers = set()
+        
+        servers = [
+            await asyncio.start_server(self.track_client(self.handle_auth_client), sock=self.socket_auth),
+            await asyncio.start_server(self.track_client(self.handle_screen_client), sock=self.socket_screen),
+            await asyncio.start_server(self.track_client(self.handle_mouse_client), sock=self.socket_mouse)
+        ]
+        
+        # Multiplexed connections run on MuxConnection's own threads, so they are accepted as plain sockets
+        self.socket_mux.setblocking(False)
+        mux_task = self.loop.create_task(self.accept_mux_connections())
+        
         try:
-            # Set a timeout on the socket
-            client_socket.settimeout(10.0)
+            await self.stop_event.wait()
+        finally:
+            # Closing the servers also closes their listening sockets
+            mux_task.cancel()
+            for server in servers:
+                server.close()
+            self.socket_mux.close()
             
-            # Receive message length
-            length_data = self.recv_all(client_socket, 4)
-            if not length_data:
-                logger.warning("No auth message length received")
-                return
+            # Close client connections; their handlers see the connection end and return
+            with self.viewers_lock:
+                viewers = list(self.viewers)
+            for viewer in viewers:
+                viewer.close()
             
-            message_length = int.from_bytes(length_data, byteorder='big')
+            for writer in list(self.client_writers):
+                writer.close()
             
-            # Receive message
-            message_data = self.recv_all(client_socket, message_length)
-            if not message_data:
-                logger.warning("No auth message data received")
+            tasks = self.client_tasks | self.mux_tasks
+            if tasks:
+                await asyncio.wait(tasks, timeout=1.0)
+    
+    def track_client(self, handler):
+        """Wrap a connection handler so serve() can close its connection and wait for it on shutdown"""
+        async def tracked_handler(reader, writer):
+            task = asyncio.current_task()
+            self.client_tasks.add(task)
+            self.client_writers.add(writer)
+            
+            # Notice peers that vanish without closing the connection
+            sock = writer.get_extra_info('socket')
+            if sock is not None:
+                self.enable_keepalive(sock)
+            try:
+                await handler(reader, writer)
+            finally:
+                self.client_writers.discard(writer)
+                self.client_tasks.discard(task)
+        return tracked_handler
+    
+    async def handle_auth_client(self, reader, writer):
+        """Handle a single authentication client"""
+        addr = writer.get_extra_info('peername')
+        logger.info(f"Auth client connected from {addr}")
+        
+        try:
+            # Receive the length-prefixed request, giving up on a silent client
+            try:
+                length_data = await asyncio.wait_for(reader.readexactly(4), 10.0)
+                message_length = int.from_bytes(length_data, byteorder='big')
+                message_data = await asyncio.wait_for(reader.readexactly(message_length), 10.0)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                logger.warning("No auth message received")
                 return
             
             # Parse message
             try:
                 message = json.loads(message_data.decode('utf-8'))
-                action = message.get('action')
-                
-                response = None
-                
-                if action == 'register':
-                    response = self.handle_register(message, addr[0])
-                elif action == 'login':
-                    response = self.handle_login(message, addr[0])
-                elif action == 'logout':
-                    response = self.handle_logout(message)
-                elif action == 'validate':
-                    response = self.handle_validate(message)
-                else:
-                    response = {
-                        'success': False,
-                        'message': f"Unknown action: {action}"
-                    }
-                
-                # Send response
-                self.send_json_response(client_socket, response)
                 
+                # Requests hash passwords and write the database, so they run on the auth pool
+                response = await self.loop.run_in_executor(
+                    self.auth_pool, self.handle_auth_request, message, addr[0]
+                )
             except json.JSONDecodeError:
                 logger.error("Invalid JSON request")
                 response = {
                     'success': False,
                     'message': "Invalid JSON request"
                 }
-                self.send_json_response(client_socket, response)
+            
+            # Send response
+            await self.send_json_response(writer, response)
         except Exception as e:
             logger.error(f"Error handling auth client: {e}")
             traceback.print_exc()
         finally:
-            client_socket.close()
+            writer.close()
+    
+    def handle_auth_request(self, message, ip_address):
+        """Dispatch an authentication request to its handler"""
+        action = message.get('action')
+        
+        if action == 'register':
+            return self.handle_register(message, ip_address)
+        elif action == 'login':
+            return self.handle_login(message, ip_address)
+        elif action == 'logout':
+            return self.handle_logout(message)
+        elif action == 'validate':
+            return self.handle_validate(message)
+        else:
+            return {
+                'success': False,
+                'message': f"Unknown action: {action}"
+            }
     
     def handle_register(self, request, ip_address):
         """Handle user registration"""
@@ -525,7 +936,7 @@ class RemoteControlServer:
                 'message': result
             }
     
-    def send_json_response(self, socket, response):
+    async def send_json_response(self, writer, response):
         """Send a JSON response with length prefix"""
         try:
             # Convert to JSON bytes using custom encoder for datetime objects
@@ -535,7 +946,8 @@ class RemoteControlServer:
             length = len(response_json).to_bytes(4, byteorder='big')
             
             # Send response
-            socket.sendall(length + response_json)
+            writer.write(length + response_json)
+            await writer.drain()
         except Exception as e:
             logger.error(f"Error sending response: {e}")
             # Try to send a simplified error response if the original failed
@@ -546,177 +958,735 @@ class RemoteControlServer:
                 }
                 error_json = json.dumps(error_response).encode('utf-8')
                 error_length = len(error_json).to_bytes(4, byteorder='big')
-                socket.sendall(error_length + error_json)
+                writer.write(error_length + error_json)
+                await writer.drain()
             except:
                 logger.error("Failed to send even the error response")
     
-    def handle_screen_sharing(self):
-        """Handle screen sharing connections in the main thread"""
+    async def handle_screen_client(self, reader, writer):
+        """Authenticate a screen client and stream the shared pipeline's frames to it"""
+        addr = writer.get_extra_info('peername')
+        logger.info(f"Screen client connected from {addr}")
+        
+        # Authenticate the client
+        authenticated, token, username, resume = await self.authenticate_service_client(
+            reader, writer, "screen", allow_resume=True
+        )
+        
+        if not authenticated:
+            logger.warning("Screen client authentication failed")
+            writer.close()
+            return
+        
+        # Log successful connection
+        self.log_connection("SCREEN", username, addr[0], "RESUMED" if resume else "SUCCESS")
+        
+        viewer = ScreenViewer(self.loop, writer, addr, username, token, self.frame_window)
+        if resume:
+            self.restore_viewer(viewer, resume)
+        
+        # Send monitor information, with a ticket for resuming this session
+        await self.send_monitor_info(writer, self.issue_resume_ticket(viewer))
+        
+        # Bound the frames buffered for this viewer (see ScreenViewer)
+        writer.transport.set_write_buffer_limits(high=VIEWER_HIGH_WATER, low=VIEWER_LOW_WATER)
+        
+        self.attach_viewer(viewer, resumed=resume is not None)
+        
+        control_task = self.loop.create_task(self.control_loop(viewer, reader))
+        
+        # Send this viewer's queued frames from this task
+        try:
+            await self.viewer_send_loop(viewer)
+        finally:
+            viewer.deactivate()
+            control_task.cancel()
+            self.detach_viewer(viewer)
+    
+    def attach_viewer(self, viewer, resumed=False):
+        """Register a viewer; the capture and encode stages run while any viewer is attached"""
+        with self.viewers_lock:
+            if not self.viewers and not resumed:
+                # First viewer of a new session starts from full quality; a resumed
+                # one keeps what the rate controller learned about the link
+                self.rate_controller.reset()
+            self.viewers.append(viewer)
+            self.viewers_present.set()
+        logger.info(f"Screen viewer {viewer.username}@{viewer.addr[0]} attached ({len(self.viewers)} watching)")
+    
+    def detach_viewer(self, viewer):
+        """Unregister a viewer and close its connection"""
+        with self.viewers_lock:
+            self.viewers.remove(viewer)
+            if not self.viewers:
+                self.viewers_present.clear()
+        
+        # The viewer may have been the one holding back capture
+        self.ack_received.set()
+        
+        # The viewer's resume ticket is valid for a short while from now
+        self.expire_resume_ticket(viewer)
+        
+        viewer.close()
+        logger.info(f"Screen viewer {viewer.username}@{viewer.addr[0]} detached: {viewer.get_stats()}")
+    
+    def issue_resume_ticket(self, viewer):
+        """
+        Issue a single-use ticket for resuming a viewer's session
+        
+        A client whose connection drops can present the ticket instead of its
+        token to reattach within RESUME_TICKET_LIFETIME seconds of the drop,
+        keeping its codec and viewport. A client may come back before the
+        server has noticed the drop; the ticket then replaces the viewer it
+        was issued to. The ticket does not outlive the session token it
+        stands for.
+        
+        Returns:
+            str: The ticket
+        """
+        ticket = secrets.token_urlsafe(32)
+        with self.resume_lock:
+            # Drop tickets that can no longer be redeemed
+            now = time.time()
+            for expired in [key for key, entry in self.resume_tickets.items()
+                            if entry['expires_at'] is not None and entry['expires_at'] < now]:
+                del self.resume_tickets[expired]
+            
+            # No expiry while the viewer is attached (see expire_resume_ticket)
+            self.resume_tickets[ticket] = {
+                'token': viewer.token,
+                'viewer': viewer,
+                'expires_at': None,
+                'codec': None,
+                'viewport': None
+            }
+        viewer.resume_ticket = ticket
+        return ticket
+    
+    def expire_resume_ticket(self, viewer):
+        """Start a detached viewer's ticket lifetime and record the settings to restore"""
+        with self.resume_lock:
+            entry = self.resume_tickets.get(viewer.resume_ticket)
+            if entry is not None:
+                entry['viewer'] = None
+                entry['expires_at'] = time.time() + RESUME_TICKET_LIFETIME
+                entry['codec'] = viewer.codec.name
+                entry['viewport'] = viewer.viewport_size
+    
+    def redeem_resume_ticket(self, ticket):
+        """
+        Take a resume ticket, returning its entry or None if it is unknown or expired
+        
+        Runs on the event loop. If the ticket's viewer is still attached, its
+        connection is presumed dead and the viewer is closed.
+        """
+        with self.resume_lock:
+            entry = self.resume_tickets.get(ticket)
+            if entry is None:
+                return None
+            
+            # Accepted or expired, the ticket is used up
+            del self.resume_tickets[ticket]
+            if entry['expires_at'] is not None and entry['expires_at'] < time.time():
+                return None
+            
+            old_viewer = entry['viewer']
+            if old_viewer is not None:
+                entry['viewer'] = None
+                entry['codec'] = old_viewer.codec.name
+                entry['viewport'] = old_viewer.viewport_size
+        
+        if old_viewer is not None:
+            # Its own handler detaches it once the send loop sees it deactivated
+            logger.info(f"Screen viewer {old_viewer.username}@{old_viewer.addr[0]} replaced by a resumed connection")
+            old_viewer.deactivate()
+            old_viewer.close()
+        return entry
+    
+    def enable_keepalive(self, sock):
+        """Turn on TCP keepalive for a client connection, with short timings where the platform allows"""
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            for option, value in (('TCP_KEEPIDLE', TCP_KEEPALIVE_IDLE),
+                                  ('TCP_KEEPINTVL', TCP_KEEPALIVE_INTERVAL),
+                                  ('TCP_KEEPCNT', TCP_KEEPALIVE_COUNT)):
+                if hasattr(socket, option):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+        except OSError as e:
+            logger.debug(f"Could not enable TCP keepalive: {e}")
+    
+    def restore_viewer(self, viewer, resume):
+        """Give a resumed viewer the settings it had before the connection dropped"""
+        viewer.codec = get_codec(resume['codec'])
+        viewer.viewport_size = resume['viewport']
+        logger.info(f"Screen viewer {viewer.username} resumed its session")
+    
+    async def accept_mux_connections(self):
+        """Accept multiplexed connections"""
         while self.running:
-            # Accept a screen sharing connection
-            logger.info("Waiting for screen sharing client...")
             try:
-                readable, _, _ = select.select([self.socket_screen], [], [], 1)
+                client_socket, addr = await self.loop.sock_accept(self.socket_mux)
+                logger.info(f"Multiplexed client connected from {addr}")
                 
-                if readable:
-                    self.screen_client, addr = self.socket_screen.accept()
-                    logger.info(f"Screen client connected from {addr}")
-                    
-                    # Authenticate the client
-                    authenticated, token, username = self.authenticate_service_client(
-                        self.screen_client, "screen"
-                    )
-                    
-                    if not authenticated:
-                        logger.warning("Screen client authentication failed")
-                        self.screen_client.close()
-                        self.screen_client = None
-                        continue
-                    
-                    # Store the token for this connection
-                    self.screen_token = token
-                    
-                    # Log successful connection
-                    self.log_connection("SCREEN", username, addr[0], "SUCCESS")
-                    
-                    # Send monitor information
-                    self.send_monitor_info()
-                    
-                    # Main loop for sending screen captures
-                    while self.running and self.screen_client:
-                        try:
-                            # Capture and send screenshot
-                            screenshot_data = self.capture_screenshot()
-                            message_size = struct.pack("L", len(screenshot_data))
-                            self.screen_client.sendall(message_size + screenshot_data)
-                            
-                            # Short sleep to limit frame rate
-                            time.sleep(0.03)
-                            
-                        except (ConnectionResetError, BrokenPipeError):
-                            logger.info("Screen client disconnected")
-                            break
-                        except Exception as e:
-                            logger.error(f"Screen sharing error: {e}")
-                            traceback.print_exc()
-                            break
-                    
-                    # Clean up
-                    if self.screen_client:
-                        self.screen_client.close()
-                    
-                    self.screen_client = None
-                    self.screen_token = None
+                # The loop only keeps weak references to tasks
+                task = self.loop.create_task(self.handle_mux_client(client_socket, addr))
+                self.mux_tasks.add(task)
+                task.add_done_callback(self.mux_tasks.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.running:
+                    logger.error(f"Multiplexed connection error: {e}")
+                    traceback.print_exc()
+                    await asyncio.sleep(1)
+    
+    async def handle_mux_client(self, client_socket, addr):
+        """
+        Run one session over a multiplexed connection
+        
+        The client's first control message is a hello carrying a session token,
+        a resume ticket or a username and password. The welcome reply carries
+        the monitor information and a new resume ticket, so the session is set
+        up in one round trip. After that the control channel takes screen
+        control messages and the input channel takes input batches, which are
+        queued ahead of any screen data.
+        
+        MuxConnection still reads and writes the socket on two threads of its
+        own; the hello is handed to this task, so logins run on auth_pool.
+        """
+        # MuxConnection does blocking I/O on its own threads
+        client_socket.setblocking(True)
+        
+        # Small input and control chunks must not wait for Nagle behind screen data
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.enable_keepalive(client_socket)
+        
+        session = {'viewer': None}
+        hello = self.loop.create_future()
+        
+        def deliver_hello(message):
+            # None if the connection closed before a hello arrived
+            try:
+                self.loop.call_soon_threadsafe(lambda: hello.done() or hello.set_result(message))
+            except RuntimeError:
+                # The event loop has already shut down
+                pass
+        
+        # The handlers run on the connection's receiver thread
+        def on_control(message):
+            message = json.loads(message.decode('utf-8'))
+            viewer = session['viewer']
+            if viewer is not None:
+                self.handle_screen_control(viewer, message)
+                return
+            
+            if message.get('type') != 'hello':
+                raise ValueError(f"Expected hello, got {message.get('type')}")
+            deliver_hello(message)
+        
+        def on_input(message):
+            # Input is only accepted once the session is authenticated
+            if session['viewer'] is None:
+                raise ConnectionError("Input before authentication")
+            
+            count, = INPUT_BATCH.unpack_from(message)
+            if count <= 0 or count > MAX_INPUT_BATCH or len(message) != INPUT_BATCH.size + count * INPUT_EVENT.size:
+                raise ValueError(f"Invalid input batch: {count} events in {len(message)} bytes")
+            
+            self.queue_input_batch(memoryview(message)[INPUT_BATCH.size:])
+        
+        def on_close():
+            viewer = session['viewer']
+            if viewer is not None:
+                viewer.deactivate()
+            deliver_hello(None)
+        
+        connection = MuxConnection(client_socket, {
+            CHANNEL_CONTROL: on_control,
+            CHANNEL_INPUT: on_input
+        }, on_close=on_close)
+        connection.start()
+        
+        # Wait for the hello; the connection closes on failure, which also wakes us
+        try:
+            message = await asyncio.wait_for(hello, 10.0)
+        except asyncio.TimeoutError:
+            message = None
+        
+        viewer, resumed = None, False
+        if message is not None:
+            try:
+                viewer, resumed = await self.authenticate_mux_client(connection, message, addr, session)
             except Exception as e:
-                logger.error(f"Screen connection error: {e}")
+                logger.error(f"Multiplexed authentication error: {e}")
                 traceback.print_exc()
-                time.sleep(1)
+        
+        if viewer is None or connection.closed:
+            if viewer is not None:
+                # Let the ticket from the welcome lapse like any other
+                self.expire_resume_ticket(viewer)
+            logger.warning(f"Multiplexed client {addr[0]} did not authenticate")
+            connection.close()
+            return
+        
+        self.attach_viewer(viewer, resumed=resumed)
+        try:
+            await self.viewer_send_loop(viewer)
+        finally:
+            self.detach_viewer(viewer)
     
-    def handle_mouse_control(self):
-        """Handle mouse control connections"""
-        while self.running:
+    async def authenticate_mux_client(self, connection, message, addr, session):
+        """
+        Authenticate a multiplexed client's hello and send the welcome
+        
+        The viewer is published in session before the welcome goes out, so
+        the control messages the client sends in reply find it.
+        
+        Returns:
+            tuple: (MuxScreenViewer or None if authentication failed, whether the session was resumed)
+        """
+        # A client coming back after a network blip presents its resume ticket
+        resume = None
+        if message.get('resume_ticket'):
+            resume = self.redeem_resume_ticket(message['resume_ticket'])
+        
+        # Log in on this connection unless the client already holds a session token
+        token = resume['token'] if resume else message.get('token')
+        if not token:
+            login = await self.loop.run_in_executor(self.auth_pool, self.handle_login, message, addr[0])
+            if not login['success']:
+                await self.send_mux_control(connection, {'type': 'welcome', 'success': False, 'message': login['message']})
+                return None, False
+            token = login['token']
+        
+        success, user_data = await self.loop.run_in_executor(
+            self.auth_pool, self.user_db.validate_session, token
+        )
+        if not success:
+            self.log_connection("MUX", None, addr[0], "FAILED")
+            await self.send_mux_control(connection, {
+                'type': 'welcome',
+                'success': False,
+                'message': f"Authentication failed: {user_data}"
+            })
+            return None, False
+        
+        username = user_data['username']
+        self.log_connection("MUX", username, addr[0], "RESUMED" if resume else "SUCCESS")
+        
+        # Event IDs start over with each input connection
+        self.last_input = (0, 0.0)
+        
+        viewer = MuxScreenViewer(self.loop, connection, addr, username, token, self.frame_window)
+        if resume:
+            self.restore_viewer(viewer, resume)
+        
+        welcome = self.get_monitor_info()
+        welcome.update({
+            'type': 'welcome',
+            'success': True,
+            'token': token,
+            'resume_ticket': self.issue_resume_ticket(viewer),
+            'resume_lifetime': RESUME_TICKET_LIFETIME
+        })
+        session['viewer'] = viewer
+        connection.send_json(welcome)
+        return viewer, resume is not None
+    
+    async def send_mux_control(self, connection, message):
+        """Send a control message on a multiplexed connection and wait until it has been written"""
+        sent = self.loop.create_future()
+        
+        def on_sent():
             try:
-                logger.info("Waiting for mouse control client...")
-                self.mouse_client, addr = self.socket_mouse.accept()
-                logger.info(f"Mouse control client connected from {addr}")
+                self.loop.call_soon_threadsafe(lambda: sent.done() or sent.set_result(None))
+            except RuntimeError:
+                # The event loop has already shut down
+                pass
+        
+        if connection.send(CHANNEL_CONTROL, json.dumps(message).encode('utf-8'), on_sent=on_sent):
+            await sent
+    
+    async def viewer_send_loop(self, viewer):
+        """Sender stage: write one viewer's queued frames to its connection"""
+        try:
+            while self.running:
+                # Hold off while too much is in flight. Frames queued meanwhile
+                # overflow the queue and give way to a keyframe, so the viewer
+                # gets a current frame once the link recovers.
+                stall_time = 0.0
+                if viewer.bytes_in_flight() > VIEWER_HIGH_WATER:
+                    viewer.stalls += 1
+                    viewer.stall_start = time.time()
+                    try:
+                        await viewer.wait_writable()
+                    finally:
+                        stall_time = time.time() - viewer.stall_start
+                        viewer.stall_time += stall_time
+                        viewer.stall_start = None
+                else:
+                    # Surfaces a lost connection
+                    await viewer.wait_writable()
                 
-                # Authenticate the client
-                authenticated, token, username = self.authenticate_service_client(
-                    self.mouse_client, "mouse"
-                )
+                next_frame = await viewer.next_frame()
+                if next_frame is None:
+                    break
+                screenshot_data, sequence = next_frame
+                
+                # Count the frame as unacknowledged before the viewer can possibly acknowledge it
+                viewer.unacked.append((sequence & 0xFFFFFFFF, time.time()))
+                viewer.send_frame(screenshot_data)
+                
+                # The time a frame was held back by the connection is its send latency.
+                # This is 0 below VIEWER_HIGH_WATER; queueing below the mark shows up
+                # in the acknowledgement round trip instead (see handle_screen_control)
+                self.rate_controller.record_send(stall_time)
+                viewer.frames_sent += 1
+                viewer.bytes_sent += len(screenshot_data)
                 
-                if not authenticated:
-                    logger.warning("Mouse client authentication failed")
-                    self.mouse_client.close()
-                    self.mouse_client = None
+        except (ConnectionResetError, BrokenPipeError, ConnectionError):
+            logger.info("Screen client disconnected")
+        except Exception as e:
+            if viewer.active.is_set():
+                logger.error(f"Screen sharing error: {e}")
+                traceback.print_exc()
+    
+    def capture_loop(self):
+        """Capture stage: grab frames at the target rate while viewers are attached"""
+        last_frame_time = 0
+        
+        # mss handles are per-thread on Windows, so open one for this thread
+        with mss.mss() as sct:
+            while self.running:
+                # Idle until a viewer attaches
+                if not self.viewers_present.wait(0.5):
                     continue
                 
-                # Store the token for this connection
-                self.mouse_token = token
+                # Skip capturing while every viewer has a full window; an ack wakes us
+                self.ack_received.clear()
+                if not self.frame_window_open():
+                    self.window_waits += 1
+                    self.ack_received.wait(0.5)
+                    continue
                 
-                # Log successful connection
-                self.log_connection("MOUSE", username, addr[0], "SUCCESS")
+                try:
+                    start_time = time.time()
+                    
+                    # Input injected up to now is reflected in this capture
+                    input_mark = self.last_input
+                    
+                    # A viewer waiting for a keyframe must get one even if the screen is static
+                    frame = self.capture_screenshot(sct, force=self.keyframe_needed())
+                    
+                    if frame is not None:
+                        self.count_pipeline_frame(1)
+                        self.put_latest(self.raw_frames, (frame, start_time, input_mark), on_drop=self.drop_raw_frame)
+                        last_frame_time = start_time
+                    else:
+                        self.static_frames += 1
+                        if start_time - last_frame_time >= self.keepalive_interval:
+                            # Never displace a pending real frame with a keep-alive
+                            self.count_pipeline_frame(1)
+                            try:
+                                self.raw_frames.put_nowait((None, start_time, input_mark))
+                                last_frame_time = start_time
+                            except queue.Full:
+                                self.count_pipeline_frame(-1)
+                    
+                    # Pace captures to the controller's frame interval rather than sleeping a fixed time
+                    frame_interval = self.rate_controller.frame_interval
+                    elapsed = time.time() - start_time
+                    if elapsed < frame_interval:
+                        time.sleep(frame_interval - elapsed)
+                except Exception as e:
+                    logger.error(f"Screen capture error: {e}")
+                    traceback.print_exc()
+                    time.sleep(1)
+    
+    def encode_loop(self):
+        """Encode stage: encode the newest captured frame once and fan it out to every viewer"""
+        while self.running:
+            try:
+                frame, capture_time, input_mark = self.raw_frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            try:
+                # Snapshot each viewer's codec once: a 'codec' message may change it
+                # while this frame is encoded, and the fan-out must use the same one
+                with self.viewers_lock:
+                    pairs = [(viewer, viewer.codec) for viewer in self.viewers]
+                if not pairs:
+                    self.release_frame((frame, capture_time, input_mark))
+                    continue
                 
-                # Main loop for processing mouse/keyboard commands
-                while self.running and self.mouse_client:
-                    try:
-                        # Set a timeout to prevent blocking forever
-                        self.mouse_client.settimeout(1.0)
-                        
-                        # Receive message length
-                        length_data = self.recv_all(self.mouse_client, 4)
-                        if not length_data:
-                            logger.debug("No mouse command length received")
-                            break
-                        
-                        message_length = int.from_bytes(length_data, byteorder='big')
-                        
-                        # Sanity check length
-                        if message_length <= 0 or message_length > 1024:
-                            logger.warning(f"Invalid mouse command length: {message_length}")
-                            break
-                        
-                        # Receive message
-                        message_data = self.recv_all(self.mouse_client, message_length)
-                        if not message_data:
-                            logger.debug("No mouse command data received")
-                            break
-                        
-                        # Process command
-                        command = message_data.decode('utf-8')
-                        self.handle_mouse_command(command)
-                        
-                    except socket.timeout:
-                        # This is expected, just continue
-                        continue
-                    except (ConnectionResetError, BrokenPipeError):
-                        logger.info("Mouse client disconnected")
-                        break
-                    except Exception as e:
-                        logger.error(f"Mouse control error: {e}")
-                        traceback.print_exc()
-                        break
+                sequence = self.frame_sequence
+                self.frame_sequence += 1
                 
-                # Clean up
-                if self.mouse_client:
-                    self.mouse_client.close()
+                # A viewer that just attached or fell behind gets a keyframe as soon as
+                # it can take one; the others stay on the shared delta chain
+                catching_up = set()
+                deltas, keyframes = {}, {}
+                if frame is not None:
+                    catching_up = {viewer for viewer, _ in pairs if viewer.needs_keyframe and viewer.window_open()}
+                    delta_codecs = list({codec for viewer, codec in pairs if viewer not in catching_up})
+                    keyframe_codecs = list({codec for viewer, codec in pairs if viewer in catching_up})
+                    deltas, keyframes = self.encode_frame(
+                        frame, capture_time, sequence, delta_codecs, keyframe_codecs, input_mark
+                    )
                 
-                self.mouse_client = None
-                self.mouse_token = None
+                # Static screen, or no tile actually changed: viewers on the delta chain
+                # get a header-only keep-alive (the codec is irrelevant)
+                keepalive_data = None
+                if deltas == {} and len(catching_up) < len(pairs):
+                    keepalive_data = self.encode_keepalive(capture_time, sequence, input_mark)
+                
+                frame_bytes = sum(len(data) for data in keyframes.values())
+                frame_bytes += sum(len(data) for data in (deltas or {}).values())
+                frame_bytes += len(keepalive_data) if keepalive_data else 0
+                self.rate_controller.record_frame(frame_bytes)
                 
+                for viewer, codec in pairs:
+                    if deltas is None or viewer in catching_up:
+                        viewer.enqueue(keyframes[codec.codec_id], True, sequence)
+                    elif deltas:
+                        viewer.enqueue(deltas[codec.codec_id], False, sequence)
+                    else:
+                        viewer.enqueue(keepalive_data, False, sequence, keepalive=True)
             except Exception as e:
-                logger.error(f"Mouse control connection error: {e}")
+                logger.error(f"Screen encode error: {e}")
                 traceback.print_exc()
-                time.sleep(1)
+            finally:
+                self.count_pipeline_frame(-1)
     
-    def authenticate_service_client(self, client_socket, service_type):
-        """Authenticate a service client using a token"""
+    async def control_loop(self, viewer, reader):
+        """Control stage: read JSON control messages sent back by a screen viewer"""
         try:
-            # Set a timeout
-            client_socket.settimeout(10.0)
+            while self.running and viewer.active.is_set():
+                message = await self.read_json_message(reader)
+                if message is None:
+                    logger.info("Screen client closed the control channel")
+                    break
+                
+                self.handle_screen_control(viewer, message)
+        except ConnectionError as e:
+            logger.info(f"Screen client disconnected: {e}")
+        except Exception as e:
+            if viewer.active.is_set():
+                logger.error(f"Screen control error: {e}")
+                traceback.print_exc()
+        finally:
+            viewer.deactivate()
+    
+    def handle_screen_control(self, viewer, message):
+        """Process a control message from a screen viewer"""
+        message_type = message.get('type')
+        
+        if message_type == 'viewport':
+            width, height = int(message['width']), int(message['height'])
+            if width > 0 and height > 0:
+                viewer.viewport_size = (width, height)
+                # The encoded size may change, so re-capture even if the screen is static
+                self.change_detector.reset()
+                logger.info(f"Screen viewer {viewer.username} viewport: {width}x{height}")
+        elif message_type == 'codec':
+            codec_name = message.get('name')
+            if codec_name in CODECS_BY_NAME:
+                viewer.codec = get_codec(codec_name)
+                # Repaint the whole screen with the new codec; a pending keyframe
+                # also bypasses static screen detection
+                viewer.needs_keyframe = True
+                logger.info(f"Screen viewer {viewer.username} codec: {codec_name}")
+            else:
+                logger.warning(f"Screen viewer {viewer.username} requested unknown codec: {codec_name}")
+        elif message_type == 'keyframe':
+            # The viewer discarded a backlog of deltas and needs a full repaint;
+            # it will not acknowledge the frames it dropped, so release its window
+            viewer.needs_keyframe = True
+            viewer.acknowledge()
+            self.ack_received.set()
+            logger.info(f"Screen viewer {viewer.username} requested a keyframe")
+        elif message_type == 'ack':
+            # The viewer has displayed every frame up to this sequence number; the
+            # round trip covers the network, the client's decode and its display
+            round_trip = viewer.acknowledge(int(message['sequence']))
+            if round_trip is not None:
+                self.rate_controller.record_client_latency(round_trip)
+            self.ack_received.set()
+        else:
+            logger.warning(f"Unknown screen control message: {message_type}")
+    
+    def keyframe_needed(self):
+        """Check whether any viewer that can take a frame is waiting for a keyframe"""
+        with self.viewers_lock:
+            return any(viewer.needs_keyframe and viewer.window_open() for viewer in self.viewers)
+    
+    def frame_window_open(self):
+        """Check whether any viewer has room for another frame beyond those already in the pipeline"""
+        with self.viewers_lock:
+            viewers = list(self.viewers)
+        pending = self.frames_in_pipeline
+        return any(viewer.window_open(pending) for viewer in viewers)
+    
+    def count_pipeline_frame(self, delta):
+        """Track frames between capture and the viewers' queues"""
+        with self.pipeline_lock:
+            self.frames_in_pipeline += delta
+    
+    def get_target_viewport(self):
+        """Get the viewport to encode for: the largest declared by any viewer, or None for full size"""
+        with self.viewers_lock:
+            viewports = [viewer.viewport_size for viewer in self.viewers]
+        
+        # Frames are shared, so one viewer at full resolution means full resolution for all
+        if not viewports or None in viewports:
+            return None
+        
+        return max(width for width, _ in viewports), max(height for _, height in viewports)
+    
+    def get_stream_stats(self):
+        """Get screen streaming statistics, including the rate controller's decisions"""
+        stats = self.rate_controller.get_stats()
+        stats['frames_encoded'] = self.frame_sequence
+        stats['dropped_captures'] = self.dropped_frames
+        stats['static_frames'] = self.static_frames
+        stats['window_waits'] = self.window_waits
+        stats['codecs'] = {name: get_codec(name).get_stats() for name in get_codec_names()}
+        with self.viewers_lock:
+            stats['viewers'] = [viewer.get_stats() for viewer in self.viewers]
+        return stats
+    
+    def put_latest(self, frame_queue, item, on_drop=None):
+        """Put an item on a bounded queue, discarding the oldest entry when it is full"""
+        while True:
+            try:
+                frame_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    dropped = frame_queue.get_nowait()
+                    self.dropped_frames += 1
+                    if on_drop:
+                        on_drop(dropped)
+                except queue.Empty:
+                    pass
+    
+    def drop_raw_frame(self, item):
+        """Discard a captured item displaced from the raw frame queue"""
+        self.count_pipeline_frame(-1)
+        self.release_frame(item)
+    
+    def release_frame(self, item):
+        """Return a dropped (frame, capture time, input mark) item's buffer to the frame pool"""
+        frame = item[0]
+        if frame is not None:
+            self.frame_pool.release(frame)
+    
+    async def handle_mouse_client(self, reader, writer):
+        """Handle a mouse control connection"""
+        addr = writer.get_extra_info('peername')
+        logger.info(f"Mouse control client connected from {addr}")
+        
+        # Authenticate the client
+        authenticated, token, username, _ = await self.authenticate_service_client(
+            reader, writer, "mouse"
+        )
+        
+        if not authenticated:
+            logger.warning("Mouse client authentication failed")
+            writer.close()
+            return
+        
+        # The same session connecting again means its old connection is dead
+        # even if the server has not noticed yet, so it gives way
+        if self.mouse_client is not None and self.mouse_token == token:
+            logger.info(f"Mouse control for {username} moved to a new connection")
+            self.mouse_client.close()
+        
+        # Only one client controls the mouse at a time; later ones wait their turn
+        async with self.mouse_lock:
+            # Store the connection and its token
+            self.mouse_client = writer
+            self.mouse_token = token
+            
+            # Event IDs start over with each input connection
+            self.last_input = (0, 0.0)
+            
+            # Log successful connection
+            self.log_connection("MOUSE", username, addr[0], "SUCCESS")
             
-            # Receive token length
-            length_data = self.recv_all(client_socket, 4)
-            if not length_data:
+            # Main loop for receiving mouse/keyboard event batches
+            try:
+                while self.running:
+                    # Receive the batch header
+                    header_data = await reader.readexactly(INPUT_BATCH.size)
+                    count, = INPUT_BATCH.unpack(header_data)
+                    
+                    # Sanity check count
+                    if count <= 0 or count > MAX_INPUT_BATCH:
+                        logger.warning(f"Invalid input batch size: {count}")
+                        break
+                    
+                    # Receive the events
+                    event_data = await reader.readexactly(count * INPUT_EVENT.size)
+                    
+                    # Hand the batch to the injection worker and go straight back to reading
+                    self.queue_input_batch(event_data)
+                    
+            except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+                logger.info("Mouse client disconnected")
+            except Exception as e:
+                logger.error(f"Mouse control error: {e}")
+                traceback.print_exc()
+            finally:
+                # Clean up
+                writer.close()
+                self.mouse_client = None
+                self.mouse_token = None
+    
+    async def authenticate_service_client(self, reader, writer, service_type, allow_resume=False):
+        """
+        Authenticate a service client using a token
+        
+        With allow_resume the client may present a resume ticket instead (see
+        issue_resume_ticket); it stands in for the session token it was issued for.
+        
+        Returns:
+            tuple: (success, session token, username, resumed viewer settings or None)
+        """
+        try:
+            # Receive token length, giving up on a silent client
+            try:
+                length_data = await asyncio.wait_for(reader.readexactly(4), 10.0)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError):
                 logger.warning(f"No {service_type} auth token length received")
-                return False, None, None
+                return False, None, None, None
             
             token_length = int.from_bytes(length_data, byteorder='big')
             
             # Sanity check length
             if token_length <= 0 or token_length > 1024:
                 logger.warning(f"Invalid {service_type} auth token length: {token_length}")
-                return False, None, None
+                return False, None, None, None
             
             # Receive token
-            token_data = self.recv_all(client_socket, token_length)
-            if not token_data:
+            try:
+                token_data = await asyncio.wait_for(reader.readexactly(token_length), 10.0)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError):
                 logger.warning(f"No {service_type} auth token received")
-                return False, None, None
+                return False, None, None, None
             
-            # Validate token
             token = token_data.decode('utf-8')
-            success, user_data = self.user_db.validate_session(token)
+            
+            # A client coming back after a network blip presents its resume ticket
+            resume = self.redeem_resume_ticket(token) if allow_resume else None
+            if resume is not None:
+                token = resume['token']
+            
+            # Validate token (an expired session is written back to the database)
+            success, user_data = await self.loop.run_in_executor(
+                self.auth_pool, self.user_db.validate_session, token
+            )
             
             # Prepare response
             if success:
@@ -733,9 +1703,9 @@ class RemoteControlServer:
                 username = None
             
             # Send response
-            self.send_json_response(client_socket, response)
+            await self.send_json_response(writer, response)
             
-            return success, token, username
+            return success, token, username, resume if success else None
             
         except Exception as e:
             logger.error(f"Error during {service_type} authentication: {e}")
@@ -747,27 +1717,30 @@ class RemoteControlServer:
                     'success': False,
                     'message': f"Authentication error: {str(e)}"
                 }
-                self.send_json_response(client_socket, response)
+                await self.send_json_response(writer, response)
             except:
                 pass
             
-            return False, None, None
+            return False, None, None, None
     
-    def send_monitor_info(self):
-        """Send monitor information to the screen client"""
+    def get_monitor_info(self):
+        """Get the monitor information sent to screen clients at handshake"""
+        return {
+            'width': self.monitor['width'],
+            'height': self.monitor['height'],
+            'protocol_version': PROTOCOL_VERSION,
+            'codecs': get_codec_names()
+        }
+    
+    async def send_monitor_info(self, writer, resume_ticket):
+        """Send monitor information and the session's resume ticket to a screen client"""
         try:
-            # Prepare monitor info
-            monitor_info = {
-                'width': self.monitor['width'],
-                'height': self.monitor['height']
-            }
+            monitor_info = self.get_monitor_info()
+            monitor_info['resume_ticket'] = resume_ticket
+            monitor_info['resume_lifetime'] = RESUME_TICKET_LIFETIME
             
-            # Pickle the data
-            monitor_data = pickle.dumps(monitor_info)
-            
-            # Send with length prefix
-            data_size = struct.pack("L", len(monitor_data))
-            self.screen_client.sendall(data_size + monitor_data)
+            # Send as a length-prefixed JSON message, like the auth responses
+            await self.send_json_response(writer, monitor_info)
             
             logger.info(f"Sent monitor info: {self.monitor['width']}x{self.monitor['height']}")
             
@@ -775,111 +1748,232 @@ class RemoteControlServer:
             logger.error(f"Error sending monitor info: {e}")
             traceback.print_exc()
     
-    def capture_screenshot(self):
-        """Capture and compress a screenshot"""
-        # Capture screen
-        screenshot = np.array(self.sct.grab(self.monitor))
+    def capture_screenshot(self, sct, force=False):
+        """
+        Capture a screenshot as a BGR frame, or None if the screen has not changed
+        
+        The returned frame is a pooled buffer; the stage that drops or replaces
+        it must hand it back with self.frame_pool.release().
+        """
+        # Capture screen and view mss's BGRA buffer in place instead of copying it
+        shot = sct.grab(self.monitor)
+        screenshot = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        
+        # Skip conversion and encoding entirely while the screen is static
+        if not self.change_detector.has_changed(screenshot) and not force:
+            return None
         
-        # Convert from BGRA (from mss) to BGR (for cv2)
-        frame = cv2.cvtColor(screenshot, cv2.COLOR_BGRA2BGR)
+        # Fit the frame into the viewer's display (never upscaling), then apply
+        # the rate controller's scale to reduce bandwidth
+        scale = self.rate_controller.scale
+        viewport_size = self.get_target_viewport()
+        if viewport_size:
+            viewport_width, viewport_height = viewport_size
+            scale *= min(1.0, viewport_width / shot.width, viewport_height / shot.height)
+        width = max(1, int(shot.width * scale))
+        height = max(1, int(shot.height * scale))
         
-        # Resize to reduce bandwidth (optional)
-        scale_percent = 100  # Adjust as needed (lower = smaller size)
-        width = int(frame.shape[1] * scale_percent / 100)
-        height = int(frame.shape[0] * scale_percent / 100)
-        frame = cv2.resize(frame, (width, height))
+        # Resize while still BGRA (only when the size actually changes) into a reused buffer
+        if (width, height) != (shot.width, shot.height):
+            if self.scaled_capture is None or self.scaled_capture.shape[:2] != (height, width):
+                self.scaled_capture = np.empty((height, width, 4), dtype=np.uint8)
+            screenshot = cv2.resize(screenshot, (width, height), dst=self.scaled_capture,
+                                    interpolation=cv2.INTER_AREA)
         
-        # Compress as JPEG
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]  # 85% quality
-        _, encoded_frame = cv2.imencode('.jpg', frame, encode_param)
+        # Convert from BGRA (from mss) to BGR (for cv2) into a pooled buffer
+        frame = self.frame_pool.acquire((height, width, 3))
+        cv2.cvtColor(screenshot, cv2.COLOR_BGRA2BGR, dst=frame)
         
-        # Serialize the compressed frame
-        data = pickle.dumps(encoded_frame)
-        return data
+        return frame
     
-    def handle_mouse_command(self, command):
-        """Process mouse and keyboard commands"""
-        try:
-            parts = command.split(',')
-            action = parts[0]
+    def encode_frame(self, frame, capture_time, sequence, delta_codecs, keyframe_codecs, input_mark=(0, 0.0)):
+        """
+        Compress a frame as the set of tiles changed since the last one, and as a keyframe where needed
+        
+        Viewers following the delta chain share one delta per codec. A viewer
+        that just attached or fell behind gets a keyframe of the same frame
+        instead, so catching it up costs the other viewers nothing.
+        
+        Args:
+            frame (np.ndarray): BGR frame
+            capture_time (float): Time the frame was captured
+            sequence (int): Frame sequence number
+            delta_codecs (list): Codecs of the viewers following the delta chain
+            keyframe_codecs (list): Codecs of the viewers that need a keyframe
+            input_mark (tuple): (event ID, injection time) of the last input injected before capture
+        
+        Returns:
+            tuple: (dict of codec id -> delta message, empty if no tile changed, or None
+            if every viewer gets the keyframe; dict of codec id -> keyframe message)
+        """
+        height, width = frame.shape[:2]
+        
+        # Without a usable reference frame every viewer needs a keyframe
+        rects = []
+        keyframe_for_all = self.previous_frame is None or self.previous_frame.shape != frame.shape
+        if not keyframe_for_all and delta_codecs:
+            # Find the tiles that changed since the previous frame
+            if self.change_mask is None or self.change_mask.shape != frame.shape:
+                self.change_mask = np.empty(frame.shape, dtype=bool)
+            rects, changed_fraction = find_changed_tiles(
+                frame, self.previous_frame, self.tile_size, mask=self.change_mask
+            )
+            # Many small JPEGs cost more than one big one once most of the screen changed
+            keyframe_for_all = changed_fraction > KEYFRAME_THRESHOLD
+        
+        if keyframe_for_all:
+            keyframe_codecs = list(set(keyframe_codecs) | set(delta_codecs))
+            delta_codecs = []
+        
+        # The old reference frame's buffer can go back to the capture stage
+        if self.previous_frame is not None:
+            self.frame_pool.release(self.previous_frame)
+        self.previous_frame = frame
+        
+        # Split full frames into one strip per worker so they encode in parallel
+        strips = split_strips(width, height, self.encode_workers) if keyframe_codecs else []
+        
+        deltas = None if keyframe_for_all else {}
+        keyframes = {}
+        groups = [(deltas, codec, rects, 0) for codec in delta_codecs if rects]
+        groups += [(keyframes, codec, strips, FLAG_KEYFRAME) for codec in keyframe_codecs]
+        
+        # Compress each region with each codec, concurrently when there is more than one job
+        quality = self.rate_controller.quality
+        jobs = [(codec, rect) for _, codec, group_rects, _ in groups for rect in group_rects]
+        
+        def encode_rect(job):
+            codec, (x, y, w, h) = job
+            return x, y, w, h, codec.timed_encode(frame[y:y + h, x:x + w], quality)
+        
+        if len(jobs) > 1:
+            encoded_tiles = list(self.encode_pool.map(encode_rect, jobs))
+        else:
+            encoded_tiles = [encode_rect(job) for job in jobs]
+        
+        # Frame each codec's compressed tiles with the binary header
+        start = 0
+        for output, codec, group_rects, flags in groups:
+            tiles = encoded_tiles[start:start + len(group_rects)]
+            start += len(group_rects)
+            output[codec.codec_id] = pack_frame(
+                sequence, capture_time, width, height, tiles,
+                codec=codec.codec_id, flags=flags,
+                input_id=input_mark[0], input_time=input_mark[1]
+            )
+        return deltas, keyframes
+    
+    def encode_keepalive(self, capture_time, sequence, input_mark=(0, 0.0)):
+        """Build a header-only frame telling viewers the screen is unchanged"""
+        return pack_frame(sequence, capture_time, 0, 0, [], flags=FLAG_KEEPALIVE,
+                          input_id=input_mark[0], input_time=input_mark[1])
+    
+    def queue_input_batch(self, event_data):
+        """Hand a batch of packed input events to the injection worker"""
+        self.input_queue.put((list(INPUT_EVENT.iter_unpack(event_data)), time.time()))
+    
+    def input_worker(self):
+        """Inject queued input events in arrival order, recording how long each waited"""
+        while self.running:
+            item = self.input_queue.get()
+            if item is None:
+                break
             
-            if action == 'move':
-                x, y = int(float(parts[1])), int(float(parts[2]))
-                self.mouse.position = (x, y)
-            elif action == 'click':
-                x, y = int(float(parts[1])), int(float(parts[2]))
+            events, received_at = item
+            for event in events:
+                queue_delay = time.time() - received_at
+                with self.input_stats_lock:
+                    self.input_events += 1
+                    self.input_queue_delay_total += queue_delay
+                    self.input_queue_delay_max = max(self.input_queue_delay_max, queue_delay)
+                
+                self.handle_input_event(event)
+                self.last_input = (event[2], time.time())
+    
+    def get_input_stats(self):
+        """Get input injection statistics (queueing delays in seconds)"""
+        with self.input_stats_lock:
+            return {
+                'events': self.input_events,
+                'queued_batches': self.input_queue.qsize(),
+                'avg_queue_delay': self.input_queue_delay_total / self.input_events if self.input_events else None,
+                'max_queue_delay': self.input_queue_delay_max
+            }
+    
+    def handle_input_event(self, event):
+        """
+        Inject one decoded input event
+        
+        Args:
+            event (tuple): (event type, button, event ID, key code, x, y, client timestamp)
+                as unpacked from INPUT_EVENT
+        """
+        event_type, button, event_id, key_code, x, y, timestamp = event
+        try:
+            if event_type == EVENT_MOVE:
                 self.mouse.position = (x, y)
-                self.mouse.click(MouseButton.left)
-            elif action == 'right_click':
-                x, y = int(float(parts[1])), int(float(parts[2]))
+            elif event_type == EVENT_CLICK:
                 self.mouse.position = (x, y)
-                self.mouse.click(MouseButton.right)
-            elif action == 'scroll':
-                dx, dy = int(float(parts[1])), int(float(parts[2]))
-                self.mouse.scroll(dx, dy)
-            elif action == 'key_press':
-                key = parts[1]
-                if key.startswith('Key.'):
-                    key = getattr(Key, key.split('.')[1])
-                self.keyboard.press(key)
-            elif action == 'key_release':
-                key = parts[1]
-                if key.startswith('Key.'):
-                    key = getattr(Key, key.split('.')[1])
-                self.keyboard.release(key)
+                self.mouse.click(self.mouse_buttons[button])
+            elif event_type == EVENT_SCROLL:
+                self.mouse.scroll(x, y)
+            elif event_type == EVENT_KEY_PRESS:
+                self.keyboard.press(self.resolve_key(key_code))
+            elif event_type == EVENT_KEY_RELEASE:
+                self.keyboard.release(self.resolve_key(key_code))
             else:
-                logger.warning(f"Unknown command: {action}")
+                logger.warning(f"Unknown input event type: {event_type}")
                 
         except Exception as e:
-            logger.error(f"Error processing mouse command: {e}")
+            logger.error(f"Error processing input event {event_type}: {e}")
             traceback.print_exc()
     
-    def recv_all(self, sock, length):
-        """Receive exactly 'length' bytes from a socket"""
-        data = b''
-        remaining = length
-        max_attempts = 5
-        attempts = 0
+    def resolve_key(self, key_code):
+        """Turn a wire key code into something the keyboard controller can press"""
+        if key_code < SPECIAL_KEY_BASE:
+            return chr(key_code)
+        if key_code >= VK_KEY_BASE:
+            return KeyCode.from_vk(key_code - VK_KEY_BASE)
+        return self.key_table[key_code]
+    
+    async def read_json_message(self, reader):
+        """Read a length-prefixed JSON message, returning None if the peer closed"""
+        try:
+            length_data = await reader.readexactly(4)
+        except asyncio.IncompleteReadError:
+            return None
         
-        while remaining > 0:
-            try:
-                packet = sock.recv(remaining)
-                
-                if not packet:
-                    # Connection closed
-                    if not data:
-                        return None
-                    return data
-                
-                data += packet
-                remaining = length - len(data)
-                attempts = 0
-                
-            except socket.timeout:
-                attempts += 1
-                
-                if attempts >= max_attempts:
-                    # Too many timeouts
-                    if not data:
-                        return None
-                    return data
-                
-                time.sleep(0.1)
+        message_length = int.from_bytes(length_data, byteorder='big')
+        
+        # Sanity check length
+        if message_length <= 0 or message_length > 65536:
+            raise ValueError(f"Invalid control message length: {message_length}")
         
-        return data
+        try:
+            message_data = await reader.readexactly(message_length)
+        except asyncio.IncompleteReadError:
+            return None
+        
+        return json.loads(message_data.decode('utf-8'))
     
     def log_connection(self, service_type, username, ip_address, status):
-        """Log connection information to a file"""
+        """Log connection information to a file (written in the background)"""
+        # Create log filename and entry now, so they reflect when the event happened
+        date_str = time.strftime("%Y-%m-%d")
+        log_file = os.path.join(self.logs_dir, f"connections_{date_str}.log")
+        
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        log_entry = f"{timestamp} | {service_type} | {username or 'Unknown'} | {ip_address} | {status}\n"
+        
+        try:
+            self.log_pool.submit(self.write_connection_log, log_file, log_entry)
+        except RuntimeError:
+            # The server is shutting down
+            pass
+    
+    def write_connection_log(self, log_file, log_entry):
+        """Append an entry to a connection log file"""
         try:
-            # Create log filename based on date
-            date_str = time.strftime("%Y-%m-%d")
-            log_file = os.path.join(self.logs_dir, f"connections_{date_str}.log")
-            
-            # Create log entry
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            log_entry = f"{timestamp} | {service_type} | {username or 'Unknown'} | {ip_address} | {status}\n"
-            
-            # Write to log file
             with open(log_file, 'a') as f:
                 f.write(log_entry)
                 
@@ -891,17 +1985,29 @@ class RemoteControlServer:
         logger.info("Stopping server...")
         self.running = False
         
-        # Close client connections
-        if self.screen_client:
-            self.screen_client.close()
+        # Wake the event loop; serve() closes the listeners and client connections
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.stop_event.set)
+            except RuntimeError:
+                # The loop has already finished
+                pass
+        else:
+            # Never served; close server sockets
+            self.socket_screen.close()
+            self.socket_mouse.close()
+            self.socket_auth.close()
+            self.socket_mux.close()
         
-        if self.mouse_client:
-            self.mouse_client.close()
+        # Wake the input worker so it can exit
+        self.input_queue.put(None)
+        
+        # Stop the encode and auth workers
+        self.encode_pool.shutdown(wait=False)
+        self.auth_pool.shutdown(wait=False)
         
-        # Close server sockets
-        self.socket_screen.close()
-        self.socket_mouse.close()
-        self.socket_auth.close()
+        # Let queued connection log entries reach the disk
+        self.log_pool.shutdown(wait=True)
         
         logger.info("Server stopped")
 